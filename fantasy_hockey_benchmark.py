@@ -0,0 +1,281 @@
+"""
+Fantasy Hockey Optimizerin suorituskykymittaukset.
+
+Generoi kiinteällä siemenellä synteettisen NHL-kauden (32 joukkuetta, 82 ottelua
+per joukkue eli 1312 ottelua), rostereita (12–30 pelaajaa, myös usean
+pelipaikan pelaajia) ja vapaiden agenttien listan (oletuksena 2000 riviä).
+Mittaa laskentaytimen raskaimmat funktiot 7 päivän, 30 päivän ja koko kauden
+aikaväleillä ja kirjoittaa tulokset JSON-muodossa, jotta niitä voi seurata ajan yli.
+
+Esimerkki:
+    python fantasy_hockey_benchmark.py --output benchmark.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from fantasy_hockey_core import (
+    DEFAULT_POS_LIMITS,
+    analyze_free_agents,
+    build_lineup_prefix,
+    build_schedule_index,
+    calculate_position_availability,
+    calculate_team_impact_by_position,
+    filter_schedule,
+    optimize_roster_advanced,
+    slice_optimization_result,
+    team_games_in_range,
+)
+
+NHL_TEAMS = [
+    'ANA', 'BOS', 'BUF', 'CAR', 'CBJ', 'CGY', 'CHI', 'COL', 'DAL', 'DET', 'EDM',
+    'FLA', 'LAK', 'MIN', 'MTL', 'NJD', 'NSH', 'NYI', 'NYR', 'OTT', 'PHI', 'PIT',
+    'SEA', 'SJS', 'STL', 'TBL', 'TOR', 'UTA', 'VAN', 'VGK', 'WPG', 'WSH'
+]
+
+# Pelipaikkayhdistelmät ja niiden suhteelliset osuudet generoiduissa pelaajissa
+POSITION_WEIGHTS = {
+    'C': 14, 'LW': 10, 'RW': 10, 'D': 22, 'G': 12,
+    'C/LW': 8, 'C/RW': 6, 'LW/RW': 8, 'C/LW/RW': 3, 'LW/D': 1
+}
+
+# Mittausikkunat päivinä; None tarkoittaa koko kautta
+WINDOWS = {'7d': 7, '30d': 30, 'season': None}
+
+DEFAULT_ROSTER_SIZES = (12, 20, 30)
+DEFAULT_FREE_AGENTS = 2000
+DEFAULT_SEED = 2025
+
+# --- SYNTEETTINEN DATA ---
+def generate_schedule(seed=DEFAULT_SEED, games_per_team=82, season_start='2025-10-07'):
+    """
+    Generoi Date/Visitor/Home-muotoisen runkosarjan, jossa jokainen joukkue pelaa
+    games_per_team ottelua eikä kukaan pelaa kahdesti samana päivänä.
+
+    Otteluita on 2–14 päivässä. Kunkin päivän pelaajat valitaan joukkueista, joilla
+    on eniten otteluita jäljellä, jolloin kausi päättyy kaikilla yhtä aikaa.
+    """
+    rng = np.random.default_rng(seed)
+    remaining = {team: games_per_team for team in NHL_TEAMS}
+    rows = []
+    day = pd.Timestamp(season_start)
+    while sum(remaining.values()) > 0:
+        teams_left = [team for team in NHL_TEAMS if remaining[team] > 0]
+        max_games = len(teams_left) // 2
+        if max_games == 0:
+            break
+        num_games = min(int(rng.integers(2, 15)), max_games)
+        # Satunnainen järjestys tasatilanteissa, sitten eniten jäljellä ensin
+        order = rng.permutation(len(teams_left))
+        playing = sorted((teams_left[i] for i in order), key=lambda team: -remaining[team])[:2 * num_games]
+        playing = [playing[i] for i in rng.permutation(len(playing))]
+        for visitor, home in zip(playing[0::2], playing[1::2]):
+            rows.append({'Date': day, 'Visitor': visitor, 'Home': home})
+            remaining[visitor] -= 1
+            remaining[home] -= 1
+        day += pd.Timedelta(days=1)
+    return pd.DataFrame(rows, columns=['Date', 'Visitor', 'Home'])
+
+def generate_players(size, seed=DEFAULT_SEED, name_prefix='Pelaaja', missing_fpa_share=0.0):
+    """
+    Generoi pelaajalistan sarakkeilla name, team, positions ja fantasy_points_avg.
+    missing_fpa_share kertoo, kuinka suurelta osalta FP/GP puuttuu (NaN).
+    """
+    rng = np.random.default_rng(seed)
+    positions = list(POSITION_WEIGHTS.keys())
+    weights = np.array(list(POSITION_WEIGHTS.values()), dtype=float)
+    fpa = np.round(rng.gamma(shape=4.0, scale=0.6, size=size), 2)
+    fpa[rng.random(size) < missing_fpa_share] = np.nan
+    return pd.DataFrame({
+        'name': [f"{name_prefix} {i + 1}" for i in range(size)],
+        'team': rng.choice(NHL_TEAMS, size=size),
+        'positions': rng.choice(positions, size=size, p=weights / weights.sum()),
+        'fantasy_points_avg': fpa
+    })
+
+def generate_roster(size, seed=DEFAULT_SEED):
+    """Generoi rosterin, jossa on aina vähintään kaksi maalivahtia."""
+    roster = generate_players(size, seed=seed, name_prefix='Pelaaja')
+    missing_goalies = 2 - int((roster['positions'] == 'G').sum())
+    if missing_goalies > 0:
+        skaters = roster.index[roster['positions'] != 'G'][:missing_goalies]
+        roster.loc[skaters, 'positions'] = 'G'
+    return roster
+
+def generate_free_agents(size=DEFAULT_FREE_AGENTS, seed=DEFAULT_SEED):
+    """Generoi vapaiden agenttien listan; osalta pelaajista FP/GP puuttuu."""
+    return generate_players(size, seed=seed + 1, name_prefix='Vapaa agentti', missing_fpa_share=0.05)
+
+# --- TARKISTUS ---
+def check_window_slice(schedule, roster, limits, start_date, end_date, schedule_index):
+    """
+    Tarkistaa, että koko kauden tuloksesta etusummilla rajattu aikaväli vastaa
+    aikavälin omaa optimize_roster_advanced-ajoa. Rosterin viimeiseltä pelaajalta
+    poistetaan FP/GP, jotta myös puuttuvan arvon käsittely tulee tarkistetuksi.
+    """
+    roster = roster.copy()
+    roster.loc[roster.index[-1], 'fantasy_points_avg'] = np.nan
+    season = optimize_roster_advanced(schedule, roster, limits, schedule_index=schedule_index)
+    sliced = slice_optimization_result(season, build_lineup_prefix(season, roster), start_date, end_date)
+    window = optimize_roster_advanced(
+        filter_schedule(schedule, start_date, end_date), roster, limits, schedule_index=schedule_index
+    )
+    return (
+        sliced[0] == window[0] and sliced[1] == window[1] and sliced[3] == window[3]
+        and bool(np.isclose(sliced[2], window[2]))
+    )
+
+# --- MITTAUS ---
+def time_call(func, repeat):
+    """Ajaa funktion repeat kertaa ja palauttaa ajat sekunteina sekä viimeisen tuloksen."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+def summarize(name, window, roster_size, timings, **extra):
+    entry = {
+        'benchmark': name,
+        'window': window,
+        'roster_size': roster_size,
+        'repeat': len(timings),
+        'min_s': round(min(timings), 6),
+        'median_s': round(statistics.median(timings), 6),
+        'mean_s': round(statistics.fmean(timings), 6)
+    }
+    entry.update(extra)
+    return entry
+
+def run_benchmarks(seed=DEFAULT_SEED, roster_sizes=DEFAULT_ROSTER_SIZES, free_agent_count=DEFAULT_FREE_AGENTS,
+                   repeat=3, limits=None):
+    """
+    Suorittaa kaikki mittaukset ja palauttaa JSON-muotoon sopivan sanakirjan.
+
+    Aikatauluindeksi rakennetaan kerran ikkunaa kohden mittausten ulkopuolella,
+    kuten Streamlit-sovelluksen välimuisti tekee, ja sen rakentaminen mitataan
+    omana kohtanaan. LineupCachea ei käytetä, jotta mitataan itse laskentaa.
+    Aikavälin rajaus etusummista mitataan koko kauden indeksistä ja tuloksesta,
+    kuten sovellus tekee päivämäärävälin muuttuessa, ja sen tulos tarkistetaan
+    aikavälin omaa optimointia vastaan (matches_window).
+    """
+    limits = dict(limits or DEFAULT_POS_LIMITS)
+    schedule = generate_schedule(seed)
+    free_agents = generate_free_agents(free_agent_count, seed)
+    season_start = schedule['Date'].min()
+    season_index = build_schedule_index(schedule)
+    season_results = {}
+    for roster_size in roster_sizes:
+        roster = generate_roster(roster_size, seed + roster_size)
+        result = optimize_roster_advanced(schedule, roster, limits, schedule_index=season_index)
+        season_results[roster_size] = (result, build_lineup_prefix(result, roster))
+
+    results = []
+    for window, days in WINDOWS.items():
+        if days is None:
+            schedule_window = schedule
+        else:
+            schedule_window = filter_schedule(schedule, season_start, season_start + pd.Timedelta(days=days - 1))
+
+        timings, schedule_index = time_call(lambda: build_schedule_index(schedule_window), repeat)
+        results.append(summarize('build_schedule_index', window, None, timings, games=len(schedule_window)))
+
+        window_end = schedule_window['Date'].max()
+        timings, _ = time_call(lambda: team_games_in_range(season_index, season_start, window_end), repeat)
+        results.append(summarize('team_games_in_range', window, None, timings))
+
+        for roster_size in roster_sizes:
+            roster = generate_roster(roster_size, seed + roster_size)
+
+            timings, _ = time_call(
+                lambda: optimize_roster_advanced(schedule_window, roster, limits, schedule_index=schedule_index),
+                repeat
+            )
+            results.append(summarize('optimize_roster_advanced', window, roster_size, timings))
+
+            season_result, lineup_prefix = season_results[roster_size]
+            timings, _ = time_call(
+                lambda: slice_optimization_result(season_result, lineup_prefix, season_start, window_end),
+                repeat
+            )
+            results.append(summarize(
+                'slice_optimization_result', window, roster_size, timings,
+                matches_window=check_window_slice(schedule, roster, limits, season_start, window_end, season_index)
+            ))
+
+            timings, _ = time_call(
+                lambda: calculate_position_availability(schedule_window, roster, limits, schedule_index=schedule_index),
+                repeat
+            )
+            results.append(summarize('calculate_position_availability', window, roster_size, timings))
+
+            timings, team_impact = time_call(
+                lambda: calculate_team_impact_by_position(schedule_window, roster, limits, schedule_index=schedule_index),
+                repeat
+            )
+            results.append(summarize('calculate_team_impact_by_position', window, roster_size, timings))
+
+            timings, _ = time_call(lambda: analyze_free_agents(team_impact, free_agents), repeat)
+            results.append(summarize('analyze_free_agents', window, roster_size, timings,
+                                     free_agents=len(free_agents)))
+
+    return {
+        'metadata': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'seed': seed,
+            'repeat': repeat,
+            'limits': limits,
+            'teams': len(NHL_TEAMS),
+            'season_games': len(schedule),
+            'season_days': int(schedule['Date'].nunique()),
+            'roster_sizes': list(roster_sizes),
+            'free_agents': len(free_agents),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform()
+        },
+        'results': results
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fantasy Hockey Optimizerin suorituskykymittaukset")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="Satunnaislukugeneraattorin siemen")
+    parser.add_argument('--repeat', type=int, default=3, help="Kuinka monta kertaa kukin mittaus toistetaan")
+    parser.add_argument('--roster-sizes', default=','.join(str(size) for size in DEFAULT_ROSTER_SIZES),
+                        help="Pilkulla erotetut rosterikoot (12–30)")
+    parser.add_argument('--free-agents', type=int, default=DEFAULT_FREE_AGENTS,
+                        help="Vapaiden agenttien määrä (enintään 2000)")
+    parser.add_argument('--output', help="JSON-tiedosto, johon tulokset kirjoitetaan (oletuksena stdout)")
+    args = parser.parse_args(argv)
+
+    roster_sizes = [int(size) for size in args.roster_sizes.split(',') if size.strip()]
+    if any(size < 12 or size > 30 for size in roster_sizes):
+        parser.error("Rosterikokojen tulee olla välillä 12–30.")
+    if not 1 <= args.free_agents <= 2000:
+        parser.error("Vapaiden agenttien määrän tulee olla välillä 1–2000.")
+
+    report = run_benchmarks(args.seed, roster_sizes, args.free_agents, args.repeat)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"Kirjoitettu: {args.output}")
+    else:
+        print(output)
+    if any(entry.get('matches_window') is False for entry in report['results']):
+        print("Virhe: etusummilla rajattu tulos poikkeaa aikavälin optimoinnista.", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+Fantasy Hockey Optimizerin komentorivityökalu.
+
+Ajaa samat laskennat kuin Streamlit-sovellus ilman käyttöliittymää ja kirjoittaa
+tulokset CSV- ja JSON-tiedostoiksi, jotta ajot voidaan ajastaa (esim. cron).
+
+Esimerkkejä:
+    python fantasy_hockey_cli.py optimize --schedule nhl_schedule_saved.csv --roster my_roster_saved.csv
+    python fantasy_hockey_cli.py free-agents --roster my_roster_saved.csv --free-agents fa.csv --mode marginal
+    python fantasy_hockey_cli.py league --league league_rosters/ --workers 4
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+from fantasy_hockey_core import (
+    DEFAULT_POS_LIMITS,
+    LineupCache,
+    PersistentLineupCache,
+    analyze_free_agents,
+    build_schedule_index,
+    calculate_position_availability,
+    calculate_team_impact_by_position,
+    filter_schedule,
+    lineup_frame,
+    load_free_agents_csv,
+    load_league_rosters,
+    load_roster_csv,
+    load_schedule_csv,
+    optimize_roster_advanced,
+    project_league,
+    rank_free_agents_by_marginal_value,
+)
+from fantasy_hockey_metrics import PhaseMetrics, ProfileCapture, metrics
+
+SCHEDULE_FILE = 'nhl_schedule_saved.csv'
+ROSTER_FILE = 'my_roster_saved.csv'
+
+def parse_limits(limits_str):
+    """Muuntaa merkkijonon 'C=3,LW=3,...' pelipaikkarajoituksiksi oletusarvojen päälle."""
+    limits = dict(DEFAULT_POS_LIMITS)
+    if not limits_str:
+        return limits
+    for item in limits_str.split(','):
+        pos, sep, value = item.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Virheellinen rajoitus '{item}', odotettiin muotoa POS=N")
+        limits[pos.strip().upper()] = int(value)
+    return limits
+
+def load_inputs(args):
+    """
+    Lukee aikataulun ja rosterin sekä rajaa aikataulun valitulle aikavälille.
+    Liigakomento lukee rosterit itse, joten sille rosteri on None.
+    """
+    schedule = load_schedule_csv(args.schedule)
+    start_date = pd.to_datetime(args.start) if args.start else schedule['Date'].min()
+    end_date = pd.to_datetime(args.end) if args.end else schedule['Date'].max()
+    if start_date > end_date:
+        raise ValueError("Aloituspäivä ei voi olla myöhemmin kuin lopetuspäivä.")
+    schedule_filtered = filter_schedule(schedule, start_date, end_date)
+    if schedule_filtered.empty:
+        raise ValueError("Valitulla aikavälillä ei ole otteluita.")
+    roster = None if args.command == 'league' else load_roster_csv(args.roster)
+    return schedule_filtered, roster
+
+def write_csv(df, output_dir, filename):
+    path = os.path.join(output_dir, filename)
+    df.to_csv(path, index=False)
+    print(f"Kirjoitettu: {path}")
+
+def run_optimize(args, schedule_df, roster_df, schedule_index, lineup_cache):
+    daily_results, player_games, total_fp, total_active_games = optimize_roster_advanced(
+        schedule_df, roster_df, args.limits,
+        num_attempts=args.num_attempts, method=args.method,
+        lineup_cache=lineup_cache, schedule_index=schedule_index
+    )
+
+    lineups = lineup_frame(daily_results, roster_df)
+    write_csv(
+        lineups[['date', 'slot', 'player']].rename(columns={'date': 'Date', 'slot': 'Slot', 'player': 'Player'}),
+        args.output_dir, 'daily_lineups.csv'
+    )
+
+    games_df = pd.DataFrame({'Pelaaja': list(player_games.keys()), 'Pelit': list(player_games.values())})
+    write_csv(games_df.sort_values('Pelit', ascending=False), args.output_dir, 'player_games.csv')
+
+    summary = {
+        'start': str(schedule_df['Date'].min().date()),
+        'end': str(schedule_df['Date'].max().date()),
+        'method': args.method,
+        'limits': args.limits,
+        'total_fantasy_points': round(float(total_fp), 2),
+        'total_active_games': int(total_active_games)
+    }
+    path = os.path.join(args.output_dir, 'summary.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"Kirjoitettu: {path}")
+
+def run_team_impact(args, schedule_df, roster_df, schedule_index, lineup_cache):
+    team_impact = calculate_team_impact_by_position(
+        schedule_df, roster_df, args.limits, lineup_cache=lineup_cache, schedule_index=schedule_index
+    )
+    frames = [df.assign(Pelipaikka=pos) for pos, df in team_impact.items()]
+    result = pd.concat(frames, ignore_index=True)[['Pelipaikka', 'Joukkue', 'Lisäpelit']]
+    write_csv(result, args.output_dir, 'team_impact.csv')
+
+def run_free_agents(args, schedule_df, roster_df, schedule_index, lineup_cache):
+    if not args.free_agents:
+        raise ValueError("Vapaiden agenttien analyysi vaatii --free-agents-tiedoston.")
+    free_agents = load_free_agents_csv(args.free_agents)
+
+    if args.mode == 'marginal':
+        result = rank_free_agents_by_marginal_value(
+            schedule_df, roster_df, free_agents, args.limits,
+            lineup_cache=lineup_cache, schedule_index=schedule_index
+        )
+    else:
+        team_impact = calculate_team_impact_by_position(
+            schedule_df, roster_df, args.limits, lineup_cache=lineup_cache, schedule_index=schedule_index
+        )
+        result = analyze_free_agents(team_impact, free_agents)
+    write_csv(result, args.output_dir, 'free_agents.csv')
+
+def run_availability(args, schedule_df, roster_df, schedule_index, lineup_cache):
+    availability = calculate_position_availability(
+        schedule_df, roster_df, args.limits, lineup_cache=lineup_cache, schedule_index=schedule_index
+    )
+    result = availability.astype(int).reset_index().rename(columns={'index': 'Date'})
+    write_csv(result, args.output_dir, 'availability.csv')
+
+def run_league(args, schedule_df, roster_df, schedule_index, lineup_cache):
+    rosters = load_league_rosters(args.league)
+    active_games, fantasy_points = project_league(
+        schedule_df, rosters, args.limits, max_workers=args.workers,
+        lineup_cache=lineup_cache, schedule_index=schedule_index
+    )
+    for df, filename in [(active_games, 'league_active_games.csv'), (fantasy_points, 'league_fp.csv')]:
+        result = df.copy()
+        result.columns = [date.strftime('%Y-%m-%d') for date in result.columns]
+        result['Yhteensä'] = result.sum(axis=1)
+        write_csv(result.reset_index(), args.output_dir, filename)
+
+def write_metrics(path):
+    output = metrics.to_prometheus() if path.endswith('.prom') else metrics.to_json()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(output)
+    print(f"Kirjoitettu: {path}")
+
+COMMANDS = {
+    'optimize': (run_optimize, "Optimoi päivittäiset kokoonpanot ja laske aktiiviset pelit"),
+    'team-impact': (run_team_impact, "Laske joukkueiden lisäpelit pelipaikoittain"),
+    'free-agents': (run_free_agents, "Analysoi vapaat agentit"),
+    'availability': (run_availability, "Laske vapaat pelipaikat päivittäin"),
+    'league': (run_league, "Projisoi koko liigan aktiiviset pelit ja FP päivittäin"),
+}
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Fantasy Hockey Optimizer komentoriviltä")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for name, (_, help_text) in COMMANDS.items():
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('--schedule', default=SCHEDULE_FILE, help="Peliaikataulun CSV (Date, Visitor, Home)")
+        sub.add_argument('--roster', default=ROSTER_FILE, help="Rosterin CSV (name, team, positions, fantasy_points_avg)")
+        sub.add_argument('--start', help="Aloituspäivä (VVVV-KK-PP), oletuksena aikataulun ensimmäinen päivä")
+        sub.add_argument('--end', help="Lopetuspäivä (VVVV-KK-PP), oletuksena aikataulun viimeinen päivä")
+        sub.add_argument('--limits', type=parse_limits, default=dict(DEFAULT_POS_LIMITS),
+                         help="Pelipaikkarajoitukset, esim. C=3,LW=3,RW=3,D=4,G=2,UTIL=1")
+        sub.add_argument('--output-dir', default='.', help="Hakemisto, johon tulokset kirjoitetaan")
+        sub.add_argument('--lineup-store',
+                         help="SQLite-tiedosto, jonka kokoonpanoja käytetään ja täydennetään (esim. lineup_store.sqlite)")
+        sub.add_argument('--metrics',
+                         help="Kirjoittaa vaiheiden kestot ja laskurit tiedostoon: .prom Prometheus-muodossa, muuten JSON")
+        sub.add_argument('--profile', help="Ajaa komennon cProfilella ja kirjoittaa profiilin .prof-tiedostoon")
+        if name == 'optimize':
+            sub.add_argument('--method', choices=['exact', 'random'], default='exact', help="Optimointimenetelmä")
+            sub.add_argument('--num-attempts', type=int, default=100, help="Satunnaistetun haun yritysten määrä")
+        if name == 'free-agents':
+            sub.add_argument('--free-agents', help="Vapaiden agenttien CSV")
+            sub.add_argument('--mode', choices=['extra-games', 'marginal'], default='extra-games',
+                             help="extra-games: joukkueanalyysin lisäpelit, marginal: todellinen FP-vaikutus")
+        if name == 'league':
+            sub.add_argument('--league', required=True,
+                             help="Hakemisto, jossa yksi rosteri-CSV per joukkue, tai CSV, jossa sarake fantasy_team")
+            sub.add_argument('--workers', type=int, default=1,
+                             help="Rinnakkaisten prosessien määrä (oletuksena 1 eli ei rinnakkaisuutta)")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    metrics.activate(PhaseMetrics(enabled=bool(args.metrics)))
+    try:
+        schedule_df, roster_df = load_inputs(args)
+        os.makedirs(args.output_dir, exist_ok=True)
+        schedule_index = build_schedule_index(schedule_df)
+        handler = COMMANDS[args.command][0]
+        lineup_cache = PersistentLineupCache(args.lineup_store) if args.lineup_store else LineupCache()
+        if args.profile:
+            with ProfileCapture() as capture:
+                handler(args, schedule_df, roster_df, schedule_index, lineup_cache)
+            with open(args.profile, 'wb') as f:
+                f.write(capture.to_bytes())
+            print(f"Kirjoitettu: {args.profile}")
+        else:
+            handler(args, schedule_df, roster_df, schedule_index, lineup_cache)
+        if args.metrics:
+            write_metrics(args.metrics)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Virhe: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
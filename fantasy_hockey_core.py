@@ -0,0 +1,1819 @@
+"""
+Fantasy Hockey Optimizerin laskentaydin ilman Streamlit-riippuvuutta.
+
+Sisältää peliaikataulun käsittelyn, päivittäisten kokoonpanojen optimoinnin,
+joukkue- ja pelipaikka-analyysit sekä vapaiden agenttien analyysin. Moduulia
+käyttävät sekä Streamlit-sovellus että komentorivityökalu (fantasy_hockey_cli.py).
+"""
+import bisect
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from fantasy_hockey_metrics import metrics
+
+SCHEDULE_COLUMNS = ['Date', 'Visitor', 'Home']
+ROSTER_COLUMNS = ['name', 'team', 'positions', 'fantasy_points_avg']
+
+# Peliaikataulun päivämäärämuoto; tallennettu aikataulu kirjoitetaan aina tässä muodossa
+SCHEDULE_DATE_FORMAT = '%Y-%m-%d'
+
+# Pelaajakohtaisen hajonnan oletus, jos rosterissa ei ole hajontasaraketta: keskihajonta = suhde × |FP/GP|
+DEFAULT_FP_STD_RATIO = 1.0
+
+# Monte Carlo -simulaatiot arvotaan enintään näin monen simulaation lohkoissa
+SIMULATION_CHUNK_SIZE = 16384
+
+# Pysyvän kokoonpanovaraston oletuskoko tavuina (tallennettujen kokoonpanojen yhteiskoko)
+DEFAULT_LINEUP_STORE_BYTES = 64 * 1024 * 1024
+
+# Oletusrajoitukset pelipaikoittain
+DEFAULT_POS_LIMITS = {'C': 3, 'LW': 3, 'RW': 3, 'D': 4, 'G': 2, 'UTIL': 1}
+
+# --- PELIAIKATAULU JA ROSTERIT ---
+def parse_schedule_dates(values):
+    """
+    Jäsentää päivämäärät ensisijaisesti muodossa SCHEDULE_DATE_FORMAT, jolloin
+    pandasin ei tarvitse päätellä muotoa rivi kerrallaan. Muissa muodoissa olevat
+    (esim. käyttäjän lataamat) aikataulut jäsennetään muodon päättelyllä.
+    """
+    try:
+        return pd.to_datetime(values, format=SCHEDULE_DATE_FORMAT)
+    except (ValueError, TypeError):
+        return pd.to_datetime(values)
+
+def normalize_schedule(schedule):
+    """
+    Muuntaa aikataulun sisäiseen muotoon: Date datetime-sarakkeeksi ja Visitor ja
+    Home kategorisiksi sarakkeiksi, joilla on yhteinen joukkueluettelo.
+    Nostaa ValueErrorin, jos sarakkeet Date, Visitor ja Home puuttuvat.
+    """
+    if schedule.empty or not all(col in schedule.columns for col in SCHEDULE_COLUMNS):
+        raise ValueError("Peliaikataulun CSV-tiedoston tulee sisältää sarakkeet: Date, Visitor, Home")
+    schedule = schedule.copy()
+    if not pd.api.types.is_datetime64_any_dtype(schedule['Date']):
+        schedule['Date'] = parse_schedule_dates(schedule['Date'])
+    visitors = pd.Categorical(schedule['Visitor'])
+    homes = pd.Categorical(schedule['Home'])
+    teams = visitors.categories.union(homes.categories)
+    schedule['Visitor'] = visitors.set_categories(teams)
+    schedule['Home'] = homes.set_categories(teams)
+    return schedule
+
+@metrics.timed('schedule_parse')
+def load_schedule_csv(source):
+    """
+    Lukee NHL-peliaikataulun CSV-tiedostosta tai tiedostomaisesta oliosta.
+    Nostaa ValueErrorin, jos sarakkeet Date, Visitor ja Home puuttuvat.
+    """
+    return normalize_schedule(pd.read_csv(source))
+
+def save_schedule_csv(schedule_df, path):
+    """Tallentaa aikataulun CSV-tiedostoksi päivämäärät muodossa SCHEDULE_DATE_FORMAT."""
+    schedule_df.to_csv(path, index=False, date_format=SCHEDULE_DATE_FORMAT)
+
+class ScheduleFileCache:
+    """
+    Aikataulutiedostojen välimuisti, jonka avaimena on tiedoston polku, muokkausaika
+    ja koko. Muuttumatonta tiedostoa ei jäsennetä uudelleen: sama prosessi saa
+    aikataulun muistista ja uusi prosessi sarakemuotoisesta Parquet-kopiosta.
+
+    Parquet-kopiot kirjoitetaan hakemistoon cache_dir. Jos pyarrow ei ole
+    asennettu, välimuisti toimii pelkästään muistissa.
+    """
+
+    def __init__(self, cache_dir='.schedule_cache'):
+        self.cache_dir = cache_dir
+        self.entries = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(path):
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    def columnar_prefix(self, path):
+        path_hash = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.cache_dir, f"{os.path.basename(path)}-{path_hash}-")
+
+    def columnar_path(self, key):
+        _, mtime_ns, size = key
+        return f"{self.columnar_prefix(key[0])}{mtime_ns}-{size}.parquet"
+
+    def load(self, path):
+        """
+        Palauttaa tiedoston aikataulun. Palautettua DataFramea ei tule muokata
+        paikallaan, koska sama olio palautetaan seuraavillakin kutsuilla.
+        Nostaa FileNotFoundErrorin tai ValueErrorin kuten load_schedule_csv.
+        """
+        key = self.make_key(path)
+        entry = self.entries.get(key[0])
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+
+        schedule = self.read_columnar(key)
+        if schedule is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            schedule = load_schedule_csv(path)
+            self.write_columnar(key, schedule)
+        self.entries[key[0]] = (key, schedule)
+        return schedule
+
+    def save(self, schedule_df, path):
+        """
+        Tallentaa aikataulun CSV-tiedostoon ja korvaa tiedoston vanhat
+        välimuistimerkinnät uudella, jotta tallennettua tiedostoa ei tarvitse jäsentää.
+        """
+        schedule = normalize_schedule(schedule_df)
+        save_schedule_csv(schedule, path)
+        self.invalidate(path)
+        key = self.make_key(path)
+        self.write_columnar(key, schedule)
+        self.entries[key[0]] = (key, schedule)
+        return schedule
+
+    def invalidate(self, path):
+        """Poistaa tiedoston aikataulun muistista ja levyltä."""
+        self.entries.pop(os.path.abspath(path), None)
+        for columnar_file in glob.glob(glob.escape(self.columnar_prefix(path)) + '*.parquet'):
+            try:
+                os.remove(columnar_file)
+            except OSError:
+                pass
+
+    @metrics.timed('schedule_columnar_read')
+    def read_columnar(self, key):
+        columnar_file = self.columnar_path(key)
+        if not os.path.exists(columnar_file):
+            return None
+        try:
+            return pd.read_parquet(columnar_file)
+        except Exception:
+            return None
+
+    def write_columnar(self, key, schedule):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for old_file in glob.glob(glob.escape(self.columnar_prefix(key[0])) + '*.parquet'):
+                os.remove(old_file)
+            schedule.to_parquet(self.columnar_path(key), index=False)
+        except Exception:
+            # Ilman pyarrow'ta tai kirjoitusoikeutta välimuisti toimii vain muistissa
+            pass
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'size': len(self.entries)}
+
+def normalize_roster(roster):
+    """
+    Tarkistaa rosterin sarakkeet ja täyttää puuttuvan 'fantasy_points_avg':n nollalla.
+    Nostaa ValueErrorin, jos sarakkeet name, team ja positions puuttuvat.
+    """
+    if roster.empty or not all(col in roster.columns for col in ['name', 'team', 'positions']):
+        raise ValueError("Rosterin CSV-tiedoston tulee sisältää sarakkeet: name, team, positions, (fantasy_points_avg)")
+    if 'fantasy_points_avg' not in roster.columns:
+        roster['fantasy_points_avg'] = 0.0
+    roster['fantasy_points_avg'] = pd.to_numeric(roster['fantasy_points_avg'], errors='coerce').fillna(0)
+    return roster
+
+def load_roster_csv(source):
+    """
+    Lukee rosterin CSV-tiedostosta. Puuttuva 'fantasy_points_avg' täytetään nollalla.
+    Nostaa ValueErrorin, jos sarakkeet name, team ja positions puuttuvat.
+    """
+    return normalize_roster(pd.read_csv(source))
+
+def load_free_agents_csv(source):
+    """
+    Lukee vapaiden agenttien listan CSV-tiedostosta. Puuttuva FP/GP jää NaN:ksi.
+    Nostaa ValueErrorin, jos jokin ROSTER_COLUMNS-sarakkeista puuttuu.
+    """
+    free_agents = pd.read_csv(source)
+    missing = [col for col in ROSTER_COLUMNS if col not in free_agents.columns]
+    if missing:
+        raise ValueError(f"Vapaiden agenttien CSV-tiedostosta puuttuvat sarakkeet: {', '.join(missing)}")
+    free_agents['fantasy_points_avg'] = pd.to_numeric(free_agents['fantasy_points_avg'], errors='coerce')
+    return free_agents
+
+def filter_schedule(schedule_df, start_date, end_date):
+    """Rajaa peliaikataulun annetulle aikavälille (päätepäivät mukaan lukien)."""
+    return schedule_df[
+        (schedule_df['Date'] >= pd.to_datetime(start_date)) &
+        (schedule_df['Date'] <= pd.to_datetime(end_date))
+    ]
+
+# --- AIKATAULUINDEKSI ---
+@metrics.timed('schedule_index')
+def build_schedule_index(schedule_df):
+    """
+    Rakentaa aikataulusta joukkue × päivä -pelimatriisin.
+
+    Palauttaa sanakirjan, jossa 'teams' ja 'dates' ovat matriisin rivien ja
+    sarakkeiden arvot, 'team_codes' ja 'date_codes' niiden indeksit ja 'games'
+    NumPy-totuusarvomatriisi, joka kertoo pelaako joukkue kyseisenä päivänä.
+
+    Lisäksi 'games_cumsum' ja 'back_to_back_cumsum' ovat joukkue × (päivät + 1)
+    -etusummat peleistä ja back-to-back-peleistä (joukkue pelasi myös edellisenä
+    kalenteripäivänä), joten aikavälin summat saadaan kahdella haulla.
+    """
+    dates = pd.to_datetime(schedule_df['Date']).dt.normalize().to_numpy()
+    date_values, date_idx = np.unique(dates, return_inverse=True)
+
+    visitors = schedule_df['Visitor'].astype(str).to_numpy()
+    homes = schedule_df['Home'].astype(str).to_numpy()
+    teams, team_idx = np.unique(np.concatenate([visitors, homes]), return_inverse=True)
+
+    games = np.zeros((len(teams), len(date_values)), dtype=bool)
+    games[team_idx[:len(visitors)], date_idx] = True
+    games[team_idx[len(visitors):], date_idx] = True
+
+    # Pari (edellinen päivä, päivä) merkitään jälkimmäiselle päivälle
+    consecutive = np.diff(date_values) == np.timedelta64(1, 'D')
+    back_to_backs = np.zeros_like(games)
+    back_to_backs[:, 1:] = games[:, 1:] & games[:, :-1] & consecutive
+
+    teams = teams.tolist()
+    dates = [pd.Timestamp(date).date() for date in date_values]
+    return {
+        'teams': teams,
+        'dates': dates,
+        'team_codes': {team: i for i, team in enumerate(teams)},
+        'date_codes': {date: i for i, date in enumerate(dates)},
+        'games': games,
+        'games_cumsum': prefix_sums(games),
+        'back_to_back_cumsum': prefix_sums(back_to_backs)
+    }
+
+def prefix_sums(values):
+    """
+    Palauttaa viimeisen akselin etusummat alkuun lisätyllä nollalla: sarakkeiden
+    lo..hi-1 summa on tulos[..., hi] - tulos[..., lo].
+    """
+    values = np.asarray(values)
+    sums = np.zeros(values.shape[:-1] + (values.shape[-1] + 1,),
+                    dtype=np.int64 if values.dtype.kind in 'biu' else float)
+    np.cumsum(values, axis=-1, out=sums[..., 1:])
+    return sums
+
+def get_date_range_codes(dates, start_date, end_date):
+    """
+    Palauttaa aikajärjestyksessä olevasta päivälistasta puoliavoimen
+    indeksivälin (lo, hi), jonka päivät osuvat välille start_date–end_date.
+    """
+    lo = bisect.bisect_left(dates, pd.Timestamp(start_date).date())
+    hi = bisect.bisect_right(dates, pd.Timestamp(end_date).date())
+    return lo, max(lo, hi)
+
+def team_games_in_range(schedule_index, start_date, end_date, teams=None):
+    """
+    Palauttaa joukkueiden pelimäärät aikavälillä aikatauluindeksin etusummista.
+    Oletuksena mukana ovat kaikki aikataulun joukkueet; aikataulusta puuttuva
+    joukkue saa nollan.
+    """
+    return range_sums(schedule_index, 'games_cumsum', start_date, end_date, teams, offset=0)
+
+def team_back_to_backs_in_range(schedule_index, start_date, end_date, teams=None):
+    """
+    Palauttaa joukkueiden back-to-back-parien määrät aikavälillä. Pari lasketaan,
+    kun sen molemmat päivät osuvat aikavälille.
+    """
+    return range_sums(schedule_index, 'back_to_back_cumsum', start_date, end_date, teams, offset=1)
+
+def range_sums(schedule_index, field, start_date, end_date, teams, offset):
+    lo, hi = get_date_range_codes(schedule_index['dates'], start_date, end_date)
+    lo = min(lo + offset, hi)
+    sums = schedule_index[field]
+    if teams is None:
+        teams = schedule_index['teams']
+        counts = sums[:, hi] - sums[:, lo]
+    else:
+        teams = [str(team) for team in teams]
+        team_codes = get_team_codes(schedule_index, teams)
+        counts = np.where(team_codes >= 0, sums[team_codes, hi] - sums[team_codes, lo], 0)
+    return pd.Series(counts, index=pd.Index(teams, name='team'), dtype=int)
+
+def get_team_codes(schedule_index, teams):
+    """Muuntaa joukkueet indeksin riveiksi. Aikataulusta puuttuva joukkue saa arvon -1."""
+    return np.array([schedule_index['team_codes'].get(str(team), -1) for team in teams], dtype=int)
+
+def get_schedule_date_codes(schedule_index, schedule_df):
+    """Palauttaa aikataulun pelipäivien sarakkeet indeksissä aikajärjestyksessä."""
+    dates = pd.to_datetime(schedule_df['Date']).dt.normalize().unique()
+    return np.array(sorted(schedule_index['date_codes'][date.date()] for date in dates), dtype=int)
+
+def get_games_matrix(schedule_index, team_codes, date_codes):
+    """
+    Palauttaa (joukkueet × päivät) -totuusarvomatriisin annetuille joukkuekoodeille
+    ja päiväsarakkeille. Tuntemattoman joukkueen (-1) rivi on kokonaan False.
+    """
+    games = schedule_index['games'][:, date_codes]
+    matrix = np.zeros((len(team_codes), len(date_codes)), dtype=bool)
+    known = team_codes >= 0
+    matrix[known] = games[team_codes[known]]
+    return matrix
+
+# --- OPTIMOINTI ---
+# Kokoonpanopaikkojen bitit pelipaikkojen kelpoisuusmaskeissa
+POSITION_BITS = {'C': 1, 'LW': 2, 'RW': 4, 'D': 8, 'G': 16, 'UTIL': 32}
+
+# Pelipaikat, joilla pelaava pelaaja kelpaa myös UTIL-paikalle (ei G)
+UTIL_ELIGIBLE_POSITIONS = ['C', 'LW', 'RW', 'D']
+UTIL_ELIGIBLE_MASK = sum(POSITION_BITS[pos] for pos in UTIL_ELIGIBLE_POSITIONS)
+
+def parse_positions(positions_str):
+    """Pilkkoo pelipaikkamerkkijonon (esim. 'C/LW' tai 'C, LW') listaksi."""
+    if pd.isna(positions_str):
+        return []
+    if isinstance(positions_str, str):
+        return [p.strip() for p in positions_str.replace(',', '/').split('/')]
+    return positions_str
+
+def positions_to_mask(positions):
+    """
+    Muuntaa pelipaikat (merkkijono tai lista) kelpoisuusmaskiksi. UTIL-bitti
+    asetetaan, jos pelaaja kelpaa C-, LW-, RW- tai D-paikalle. Tuntemattomat
+    pelipaikat ohitetaan.
+    """
+    if not isinstance(positions, (list, tuple)):
+        positions = parse_positions(positions)
+    mask = 0
+    for pos in positions:
+        mask |= POSITION_BITS.get(pos, 0)
+    if mask & UTIL_ELIGIBLE_MASK:
+        mask |= POSITION_BITS['UTIL']
+    return mask
+
+def slots_for_mask(mask, limits):
+    """Palauttaa ne kokoonpanopaikat (limits-avaimet), joiden bitti on maskissa."""
+    return tuple(pos for pos in limits.keys() if mask & POSITION_BITS.get(pos, 0))
+
+class CompactRoster:
+    """
+    Rosteri taulukkomuodossa, rakennetaan kerran rosteria kohden.
+
+    Pelaajat ovat indeksejä 0..n-1 rosterin järjestyksessä (nimi yksilöi pelaajan;
+    saman nimen viimeinen rivi jää voimaan). Pelipaikat jäsennetään vain kerran
+    kelpoisuusmaskeiksi, ja FP/GP-arvot ja FP/GP:n mukainen käsittelyjärjestys
+    ovat NumPy-taulukoita. Kokoonpanopaikat lasketaan kerran kutakin
+    pelipaikkarajoitusta kohden.
+    """
+
+    def __init__(self, roster_df):
+        roster_df = roster_df.drop_duplicates(subset='name', keep='last')
+        self.names = roster_df['name'].tolist()
+        self.teams = roster_df['team'].tolist()
+        # Pelipaikkalistat tarvitaan vain satunnaistetussa haussa, joka käy ne läpi järjestyksessä
+        self.positions = [parse_positions(positions) for positions in roster_df['positions']]
+        self.masks = np.array([positions_to_mask(positions) for positions in self.positions], dtype=np.int64)
+        if 'fantasy_points_avg' in roster_df.columns:
+            self.fpa = pd.to_numeric(roster_df['fantasy_points_avg'], errors='coerce').to_numpy(dtype=float)
+        else:
+            self.fpa = np.zeros(len(self.names))
+        # Puuttuva FP/GP käsitellään nollana järjestyksessä, negatiivisuustarkistuksessa ja pistesummissa
+        self.sort_fpa = np.nan_to_num(self.fpa, nan=0.0)
+        # Vakaa lajittelu: tasapisteissä säilytetään rosterin järjestys
+        self.order = np.argsort(-self.sort_fpa, kind='stable')
+        self.fingerprints = [
+            (name, int(mask), float(fpa)) for name, mask, fpa in zip(self.names, self.masks, self.sort_fpa)
+        ]
+        self.slot_options_by_limits = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def slot_options(self, limits):
+        """Palauttaa jokaiselle pelaajalle kelpaavat kokoonpanopaikat annetuilla rajoituksilla."""
+        limits_key = tuple(limits.items())
+        options = self.slot_options_by_limits.get(limits_key)
+        if options is None:
+            options = [slots_for_mask(mask, limits) for mask in self.masks]
+            self.slot_options_by_limits[limits_key] = options
+        return options
+
+    def team_codes(self, schedule_index):
+        return get_team_codes(schedule_index, self.teams)
+
+    def assignment_names(self, assignment):
+        """Muuntaa indeksipohjaisen kokoonpanon nimipohjaiseksi."""
+        return {
+            'active': {pos: [self.names[i] for i in players] for pos, players in assignment['active'].items()},
+            'bench': [self.names[i] for i in assignment['bench']]
+        }
+
+def find_slot_path(start_slots, active, limits, slot_options):
+    """
+    Etsii leveyshaulla täydentävän polun: ketjun pelaajasiirtoja, jonka jälkeen
+    jollekin aloituspaikalle vapautuu tilaa. Palauttaa vapaan paikan ja polun
+    vanhemmat, tai (None, vanhemmat) jos polkua ei ole.
+    """
+    parent = {}
+    queue = deque()
+    for slot in start_slots:
+        if slot not in parent:
+            parent[slot] = None
+            queue.append(slot)
+
+    while queue:
+        slot = queue.popleft()
+        if len(active[slot]) < limits[slot]:
+            return slot, parent
+        for player in active[slot]:
+            for next_slot in slot_options[player]:
+                if next_slot not in parent:
+                    parent[next_slot] = (slot, player)
+                    queue.append(next_slot)
+
+    return None, parent
+
+def solve_daily_lineup_exact(roster, available, limits, bench_negative=True):
+    """
+    Ratkaisee päivän kokoonpanon tarkasti ja deterministisesti.
+
+    Pelaajien sijoittaminen C/LW/RW/D/G/UTIL-paikoille on painotettu kaksijakoinen
+    sijoitusongelma, jonka mahtuvat pelaajajoukot muodostavat matroidin. Siksi
+    pelaajien käsittely FP/GP:n mukaan laskevassa järjestyksessä ja jokaisen
+    lisääminen täydentävää polkua pitkin (aiemmin sijoitettuja voi siirtää toiselle
+    kelpaavalle paikalle) antaa suurimmat mahdolliset fantasiapisteet ja niiden
+    joukosta suurimman aktiivisten pelaajien määrän yhdellä läpikäynnillä.
+
+    Negatiivisen FP/GP:n pelaajat jätetään oletuksena penkille, koska ne laskisivat
+    pisteitä. bench_negative=False sijoittaa nekin, jolloin tulos on kokoonpano,
+    jossa on suurin mahdollinen määrä aktiivisia pelaajia.
+
+    Args:
+        roster (CompactRoster): Rosteri.
+        available (np.ndarray): Päivänä pelaavien pelaajien totuusarvomaski.
+        limits (dict): Pelipaikkojen rajoitukset.
+        bench_negative (bool): Jätetäänkö negatiivisen FP/GP:n pelaajat penkille.
+
+    Returns:
+        dict: {'active': {paikka: [pelaajaindeksit]}, 'bench': [pelaajaindeksit]}
+    """
+    slot_options = roster.slot_options(limits)
+    active = {pos: [] for pos in limits.keys()}
+    bench = []
+    moves = 0
+
+    for player in roster.order[available[roster.order]].tolist():
+        # Negatiivinen FP/GP laskisi kokonaispisteitä, joten pelaaja jää penkille
+        if bench_negative and roster.sort_fpa[player] < 0:
+            bench.append(player)
+            continue
+
+        free_slot, parent = find_slot_path(slot_options[player], active, limits, slot_options)
+        if free_slot is None:
+            bench.append(player)
+            continue
+
+        # Siirretään polun pelaajat eteenpäin ja sijoitetaan uusi pelaaja polun alkuun
+        slot = free_slot
+        while parent[slot] is not None:
+            previous_slot, moved_player = parent[slot]
+            active[previous_slot].remove(moved_player)
+            active[slot].append(moved_player)
+            slot = previous_slot
+            moves += 1
+        active[slot].append(player)
+
+    metrics.count('lineup_moves', moves)
+    return {'active': active, 'bench': bench}
+
+def find_open_positions(active, slot_options, limits, positions):
+    """
+    Tarkistaa jokaiselle pelipaikalle, mahtuuko päivän kokoonpanoon uusi pelaaja
+    kenenkään putoamatta: joko kelpaava paikka on vapaana tai se voidaan vapauttaa
+    siirtämällä aktiivisia pelaajia toisille kelpaaville paikoille.
+    """
+    return [
+        find_slot_path(slots_for_mask(positions_to_mask([pos]), limits), active, limits, slot_options)[0] is not None
+        for pos in positions
+    ]
+
+def get_replacement_options(start_slots, active, limits, slot_options, players_fpa):
+    """
+    Selvittää, miten uusi pelaaja mahtuisi päivän optimaaliseen kokoonpanoon.
+    Palauttaa (True, None), jos kelpaava paikka on vapaana tai vapautettavissa
+    siirroilla, muuten (False, heikoin FP/GP), jossa heikoin FP/GP on pienin niiden
+    aktiivisten pelaajien joukosta, jotka uusi pelaaja voisi siirtoketjun kautta
+    syrjäyttää (inf, jos ketään ei voi syrjäyttää).
+    """
+    seen = set(start_slots)
+    queue = deque(seen)
+    weakest_fpa = np.inf
+    while queue:
+        slot = queue.popleft()
+        if len(active[slot]) < limits[slot]:
+            return True, None
+        for player in active[slot]:
+            weakest_fpa = min(weakest_fpa, players_fpa[player])
+            for next_slot in slot_options[player]:
+                if next_slot not in seen:
+                    seen.add(next_slot)
+                    queue.append(next_slot)
+    return False, weakest_fpa
+
+def solve_daily_lineup_random(roster, available, limits, num_attempts):
+    """
+    Alkuperäinen satunnaistettu haku: sekoitus, ahne sijoitus ja vaihtosilmukka.
+    Palauttaa indeksipohjaisen kokoonpanon kuten solve_daily_lineup_exact.
+    """
+    best_assignment = None
+    best_assignment_fp = -1.0
+    fpa = roster.fpa.tolist()
+    players = np.flatnonzero(available).tolist()
+    swaps = 0
+
+    for attempt in range(num_attempts):
+        shuffled_players = players.copy()
+        np.random.shuffle(shuffled_players)
+        
+        active = {pos: [] for pos in limits.keys()}
+        bench = []
+        
+        for player in shuffled_players:
+            placed = False
+            positions_list = roster.positions[player]
+            
+            # Sijoita ensin ensisijaisille paikoille
+            for pos in positions_list:
+                if pos in limits and len(active[pos]) < limits[pos]:
+                    active[pos].append(player)
+                    placed = True
+                    break
+            
+            # Jos ei sijoitettu, yritä UTIL-paikkaa
+            if not placed and 'UTIL' in limits and len(active['UTIL']) < limits['UTIL']:
+                # Tarkista, että pelaaja voi pelata UTIL-paikalla (ei G)
+                if roster.masks[player] & UTIL_ELIGIBLE_MASK:
+                    active['UTIL'].append(player)
+                    placed = True
+            
+            if not placed:
+                bench.append(player)
+        
+        # Optimointi: vaihda penkillä olevia parempia pelaajia heikompien tilalle
+        improved = True
+        while improved:
+            improved = False
+            
+            bench_copy = sorted(bench, key=lambda player: fpa[player], reverse=True)
+            
+            for bench_player in bench_copy:
+                bench_player_fpa = fpa[bench_player]
+                bench_player_positions = roster.positions[bench_player]
+                
+                swapped = False
+                for active_pos, active_players in active.items():
+                    # Järjestä aktiiviset pelaajat FP/GP:n mukaan
+                    active_sorted = sorted([(player, i) for i, player in enumerate(active_players)], key=lambda x: fpa[x[0]])
+                    
+                    for active_player, active_idx in active_sorted:
+                        active_player_fpa = fpa[active_player]
+
+                        # Tarkista, voidaanko tehdä parantava vaihto
+                        if (
+                            bench_player_fpa > active_player_fpa and 
+                            active_pos in bench_player_positions
+                        ):
+                            active_players[active_idx] = bench_player
+                            bench.remove(bench_player)
+                            bench.append(active_player)
+                            improved = True
+                            swapped = True
+                            swaps += 1
+                            break
+                    if swapped:
+                        break
+                if swapped:
+                    break
+
+        # Laske nykyisen kokoonpanon pisteet
+        current_fp = sum(
+            fpa[player]
+            for players_in_slot in active.values()
+            for player in players_in_slot
+        )
+        
+        if current_fp > best_assignment_fp:
+            best_assignment_fp = current_fp
+            best_assignment = {
+                'active': {pos: slot_players[:] for pos, slot_players in active.items()},
+                'bench': bench[:]
+            }
+        
+        elif current_fp == best_assignment_fp and best_assignment:
+            current_active_count = sum(len(slot_players) for slot_players in active.values())
+            best_active_count = sum(len(slot_players) for slot_players in best_assignment['active'].values())
+            if current_active_count > best_active_count:
+                best_assignment = {
+                    'active': {pos: slot_players[:] for pos, slot_players in active.items()},
+                    'bench': bench[:]
+                }
+
+    metrics.count('random_swaps', swaps)
+    return best_assignment
+
+class LineupCache:
+    """
+    Rajattu LRU-välimuisti päivittäisille kokoonpanoille.
+
+    Avaimena on pelipaikkojen rajoitukset ja päivän pelaajien (nimi, kelpoisuusmaski,
+    FP/GP) -sormenjälki rosterin järjestyksessä, joten saman pelaajajoukon päivät
+    ratkaistaan vain kerran. Kokoonpanot tallennetaan päivän pelaajalistan
+    sijainteina, joten ne kelpaavat mille tahansa rosterille, jossa samat pelaajat
+    pelaavat.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(roster, players, limits):
+        return (tuple(limits.items()), tuple(roster.fingerprints[i] for i in players))
+
+    def get(self, key):
+        assignment = self.entries.get(key)
+        if assignment is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return assignment
+
+    def put(self, key, assignment):
+        self.entries[key] = assignment
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+class PersistentLineupCache:
+    """
+    SQLite-tiedostoon tallentuva kokoonpanovälimuisti, jota useat istunnot,
+    prosessit ja komentoriviajot voivat käyttää yhtä aikaa.
+
+    Rajapinta ja avaimet ovat samat kuin LineupCachessa: avain (rajoitukset ja
+    päivän pelaajien sormenjälki) määräytyy aikataulusta, rosterista,
+    rajoituksista ja päivästä, mutta kelpaa myös muille aikatauluille ja
+    rostereille, joissa päivän pelaajajoukko on sama. Tietokantaan tallennetaan
+    avaimen SHA-1-tiiviste ja kokoonpano JSON-muodossa. Edessä on prosessin oma
+    LineupCache, joten toistuvat haut eivät käy levyllä.
+
+    Kun tallennettujen kokoonpanojen yhteiskoko ylittää max_bytes, vanhimmat
+    tallennukset poistetaan, kunnes kokoa on jäljellä enintään 3/4. Tietokanta
+    käyttää WAL-tilaa, ja jokaisella säikeellä ja prosessilla on oma yhteytensä.
+
+    stats-metodin tallennettujen kokoonpanojen määrä ja koko luetaan tietokannasta
+    vain ensimmäisellä kerralla ja kokotarkistuksissa; välillä niitä ylläpidetään
+    tämän prosessin tallennuksista, joten muiden prosessien tallennukset näkyvät
+    vasta seuraavan tarkistuksen jälkeen.
+    """
+
+    # Kuinka monen tallennuksen välein koko tarkistetaan
+    EVICTION_CHECK_INTERVAL = 256
+
+    def __init__(self, path, max_bytes=DEFAULT_LINEUP_STORE_BYTES, memory_entries=4096):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.memory = LineupCache(memory_entries)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.puts_since_check = 0
+        # (määrä, tavut) tietokannassa; None, kunnes luettu ensimmäisen kerran
+        self.stored = None
+
+    def __getstate__(self):
+        # Yhteydet ja lukot eivät siirry prosessista toiseen; uusi prosessi avaa omansa
+        return {'path': self.path, 'max_bytes': self.max_bytes, 'memory_entries': self.memory_entries}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['max_bytes'], state['memory_entries'])
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS lineups '
+                '(key TEXT PRIMARY KEY, assignment TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL)'
+            )
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    make_key = staticmethod(LineupCache.make_key)
+
+    @staticmethod
+    def digest(key):
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            assignment = self.memory.entries.get(key)
+            if assignment is not None:
+                self.memory.entries.move_to_end(key)
+                self.hits += 1
+                return assignment
+
+        row = self.connection().execute(
+            'SELECT assignment FROM lineups WHERE key = ?', (self.digest(key),)
+        ).fetchone()
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            stored = json.loads(row[0])
+            assignment = {
+                'active': {pos: np.array(local, dtype=int) for pos, local in stored['active'].items()},
+                'bench': np.array(stored['bench'], dtype=int)
+            }
+            self.memory.put(key, assignment)
+            self.hits += 1
+            self.disk_hits += 1
+            return assignment
+
+    def put(self, key, assignment):
+        stored = json.dumps({
+            'active': {pos: [int(i) for i in local] for pos, local in assignment['active'].items()},
+            'bench': [int(i) for i in assignment['bench']]
+        }, separators=(',', ':'))
+        with self.lock:
+            self.memory.put(key, assignment)
+            self.puts_since_check += 1
+            check_size = self.puts_since_check >= self.EVICTION_CHECK_INTERVAL
+            if check_size:
+                self.puts_since_check = 0
+
+        conn = self.connection()
+        with conn:
+            inserted = conn.execute(
+                'INSERT OR IGNORE INTO lineups (key, assignment, size, created) VALUES (?, ?, ?, ?)',
+                (self.digest(key), stored, len(stored), time.time())
+            ).rowcount
+        if inserted:
+            with self.lock:
+                if self.stored is not None:
+                    self.stored = (self.stored[0] + 1, self.stored[1] + len(stored))
+        if check_size:
+            self.evict()
+
+    def evict(self):
+        """Poistaa vanhimmat kokoonpanot, jos tallennettu koko ylittää max_bytes."""
+        conn = self.connection()
+        with conn:
+            count, total = self.read_stored(conn)
+            if total <= self.max_bytes:
+                return 0
+            target = total - self.max_bytes * 3 // 4
+            rows = conn.execute('SELECT rowid, size FROM lineups ORDER BY created, rowid').fetchall()
+            freed = 0
+            removed = []
+            for rowid, size in rows:
+                if freed >= target:
+                    break
+                removed.append((rowid,))
+                freed += size
+            conn.executemany('DELETE FROM lineups WHERE rowid = ?', removed)
+        with self.lock:
+            self.stored = (count - len(removed), total - freed)
+        return len(removed)
+
+    def read_stored(self, conn=None):
+        """Lukee tallennettujen kokoonpanojen määrän ja koon tietokannasta."""
+        stored = (conn or self.connection()).execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM lineups'
+        ).fetchone()
+        with self.lock:
+            self.stored = stored
+        return stored
+
+    def clear(self):
+        conn = self.connection()
+        with conn:
+            conn.execute('DELETE FROM lineups')
+        with self.lock:
+            self.memory.clear()
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+            self.stored = (0, 0)
+
+    def stats(self):
+        count, total = self.stored if self.stored is not None else self.read_stored()
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'size': count,
+            'bytes': total
+        }
+
+def solve_daily_lineup_cached(roster, available, limits, lineup_cache):
+    """
+    Ratkaisee päivän kokoonpanon tarkasti ja käyttää lineup_cache-välimuistia.
+    Välimuistiin tallennetaan sijainnit päivän pelaajalistassa, ei rosteri-indeksejä.
+    """
+    players = np.flatnonzero(available)
+    cache_key = LineupCache.make_key(roster, players, limits)
+    cached = lineup_cache.get(cache_key)
+    if cached is not None:
+        metrics.count('lineup_cache_hits')
+        return {
+            'active': {pos: players[local].tolist() for pos, local in cached['active'].items()},
+            'bench': players[cached['bench']].tolist()
+        }
+
+    metrics.count('lineup_cache_misses')
+    assignment = solve_daily_lineup_exact(roster, available, limits)
+    local_codes = np.full(len(roster), -1, dtype=int)
+    local_codes[players] = np.arange(len(players))
+    lineup_cache.put(cache_key, {
+        'active': {pos: local_codes[slot_players] for pos, slot_players in assignment['active'].items()},
+        'bench': local_codes[assignment['bench']]
+    })
+    return assignment
+
+def solve_roster_days(roster, plays, limits, num_attempts=100, method='exact', lineup_cache=None):
+    """
+    Ratkaisee rosterin kokoonpanot jokaiselle päivälle.
+
+    Args:
+        roster (CompactRoster): Rosteri.
+        plays (np.ndarray): (pelaajat × päivät) -totuusarvomatriisi pelipäivistä.
+
+    Returns:
+        list: Indeksipohjainen kokoonpano jokaiselle päivälle.
+    """
+    assignments = []
+    for day in range(plays.shape[1]):
+        available = plays[:, day]
+        if method == 'random':
+            assignment = solve_daily_lineup_random(roster, available, limits, num_attempts)
+        elif lineup_cache is not None:
+            assignment = solve_daily_lineup_cached(roster, available, limits, lineup_cache)
+        else:
+            assignment = solve_daily_lineup_exact(roster, available, limits)
+
+        if assignment is None:
+            assignment = {
+                'active': {pos: [] for pos in limits.keys()},
+                'bench': np.flatnonzero(available).tolist()
+            }
+        assignments.append(assignment)
+
+    metrics.count('days_solved', plays.shape[1])
+    if method == 'random':
+        metrics.count('random_attempts', plays.shape[1] * num_attempts)
+    return assignments
+
+def get_roster_plays(roster, schedule_df, schedule_index=None):
+    """
+    Palauttaa aikatauluindeksin, aikataulun päiväsarakkeet ja rosterin
+    (pelaajat × päivät) -pelimatriisin.
+    """
+    if schedule_index is None:
+        schedule_index = build_schedule_index(schedule_df)
+    date_codes = get_schedule_date_codes(schedule_index, schedule_df)
+    plays = get_games_matrix(schedule_index, roster.team_codes(schedule_index), date_codes)
+    return schedule_index, date_codes, plays
+
+def frame_fingerprint(df):
+    """Sisältöön perustuva tiiviste DataFramesta: sarakkeet ja arvot (ei indeksiä)."""
+    digest = hashlib.sha1(repr(list(df.columns)).encode('utf-8'))
+    if not df.empty:
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+class OptimizationResultCache:
+    """
+    Rajattu LRU-välimuisti kokonaisille optimointituloksille.
+
+    Avaimena on tiiviste aikataulun ja rosterin sisällöstä, pelipaikkarajoituksista,
+    optimointimenetelmästä ja aikavälistä, joten saman syötteen tulos lasketaan vain
+    kerran. Palautettuja tuloksia ei tule muokata paikallaan.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(schedule_df, roster_df, limits, method='exact', num_attempts=100, start_date=None, end_date=None):
+        return (
+            frame_fingerprint(schedule_df),
+            frame_fingerprint(roster_df),
+            tuple(limits.items()),
+            method,
+            num_attempts if method == 'random' else None,
+            str(start_date),
+            str(end_date)
+        )
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+@metrics.timed('optimize_roster_advanced')
+def optimize_roster_advanced(schedule_df, roster_df, limits, num_attempts=100, method='exact', lineup_cache=None, schedule_index=None):
+    """
+    Optimoi päivittäiset kokoonpanot. Oletuksena käytetään tarkkaa ratkaisijaa;
+    method='random' valitsee alkuperäisen satunnaistetun haun (num_attempts yritystä päivässä).
+    Tarkan ratkaisijan tulokset haetaan ja tallennetaan lineup_cache-välimuistiin, jos se annetaan.
+    Pelipäivät luetaan schedule_index-pelimatriisista; jos sitä ei anneta, se rakennetaan schedule_df:stä.
+    """
+    roster = CompactRoster(roster_df)
+    schedule_index, date_codes, plays = get_roster_plays(roster, schedule_df, schedule_index)
+    assignments = solve_roster_days(roster, plays, limits, num_attempts, method, lineup_cache)
+
+    daily_results = []
+    games = [0] * len(roster)
+    for date_code, assignment in zip(date_codes, assignments):
+        named = roster.assignment_names(assignment)
+        daily_results.append({
+            'Date': schedule_index['dates'][date_code],
+            'Active': named['active'],
+            'Bench': named['bench']
+        })
+        for slot_players in assignment['active'].values():
+            for player in slot_players:
+                games[player] += 1
+
+    player_games = dict(zip(roster.names, games))
+    total_fantasy_points = sum(
+        games_played * fpa for games_played, fpa in zip(games, roster.sort_fpa.tolist())
+    )
+    total_active_games = sum(games)
+
+    return daily_results, player_games, total_fantasy_points, total_active_games
+
+def get_changed_players(old_roster, new_roster):
+    """
+    Palauttaa niiden pelaajien nimet, jotka on lisätty, poistettu tai joiden
+    joukkue, pelipaikat tai FP/GP on muuttunut rosterien välillä.
+    """
+    old_players = dict(zip(old_roster.names, zip(old_roster.teams, old_roster.fingerprints)))
+    new_players = dict(zip(new_roster.names, zip(new_roster.teams, new_roster.fingerprints)))
+    return {
+        name for name in old_players.keys() | new_players.keys()
+        if old_players.get(name) != new_players.get(name)
+    }
+
+@metrics.timed('update_optimization_result')
+def update_optimization_result(schedule_df, old_roster_df, new_roster_df, limits, result, num_attempts=100,
+                               method='exact', lineup_cache=None, schedule_index=None):
+    """
+    Päivittää optimize_roster_advanced-tuloksen rosterimuutoksen jälkeen.
+
+    Pelaajan lisäys, poisto tai muutos vaikuttaa vain päiviin, joina sen vanha tai
+    uusi NHL-joukkue pelaa, joten vain ne päivät ratkaistaan uudelleen ja
+    player_games päivitetään niiden päivien erotuksella. Muiden päivien kokoonpanot
+    otetaan sellaisenaan aiemmasta tuloksesta, jota ei muokata.
+
+    Jos muuttumattomien pelaajien keskinäinen järjestys rosterissa on muuttunut
+    (tasapisteiden ratkaisu voisi muuttua) tai tulos on laskettu eri aikataululle,
+    optimoidaan koko aikaväli uudelleen.
+
+    Returns:
+        tuple: Kuten optimize_roster_advanced.
+    """
+    old_roster = CompactRoster(old_roster_df)
+    roster = CompactRoster(new_roster_df)
+    changed = get_changed_players(old_roster, roster)
+    schedule_index, date_codes, plays = get_roster_plays(roster, schedule_df, schedule_index)
+    daily_results, player_games, _, _ = result
+
+    same_order = (
+        [name for name in old_roster.names if name not in changed] ==
+        [name for name in roster.names if name not in changed]
+    )
+    same_dates = len(daily_results) == len(date_codes) and all(
+        day['Date'] == schedule_index['dates'][date_code] for day, date_code in zip(daily_results, date_codes)
+    )
+    if not same_order or not same_dates:
+        return optimize_roster_advanced(
+            schedule_df, new_roster_df, limits, num_attempts=num_attempts, method=method,
+            lineup_cache=lineup_cache, schedule_index=schedule_index
+        )
+
+    changed_teams = [team for name, team in zip(old_roster.names, old_roster.teams) if name in changed]
+    changed_teams += [team for name, team in zip(roster.names, roster.teams) if name in changed]
+    team_codes = get_team_codes(schedule_index, changed_teams)
+    team_codes = team_codes[team_codes >= 0]
+    affected_days = np.flatnonzero(schedule_index['games'][np.ix_(team_codes, date_codes)].any(axis=0))
+
+    games = dict(player_games)
+    daily_results = list(daily_results)
+    assignments = solve_roster_days(roster, plays[:, affected_days], limits, num_attempts, method, lineup_cache)
+    for day, assignment in zip(affected_days.tolist(), assignments):
+        for slot_players in daily_results[day]['Active'].values():
+            for name in slot_players:
+                games[name] -= 1
+        named = roster.assignment_names(assignment)
+        daily_results[day] = {
+            'Date': daily_results[day]['Date'],
+            'Active': named['active'],
+            'Bench': named['bench']
+        }
+        for slot_players in named['active'].values():
+            for name in slot_players:
+                games[name] = games.get(name, 0) + 1
+
+    player_games = {name: games.get(name, 0) for name in roster.names}
+    total_fantasy_points = sum(
+        player_games[name] * fpa for name, fpa in zip(roster.names, roster.sort_fpa.tolist())
+    )
+    total_active_games = sum(player_games.values())
+
+    return daily_results, player_games, total_fantasy_points, total_active_games
+
+# --- AIKAVÄLIN ETUSUMMAT ---
+def build_lineup_prefix(result, roster_df):
+    """
+    Rakentaa optimize_roster_advanced-tuloksesta etusummat, joista minkä tahansa
+    aikavälin pelimäärät ja pisteet saadaan ilman uutta optimointia.
+
+    Tarkka ratkaisija ratkaisee jokaisen päivän muista päivistä riippumatta, joten
+    pitkän aikavälin tuloksen osaväli on sama kuin osavälin oma optimointi.
+    Satunnaistetulle haulle tämä ei päde.
+
+    Returns:
+        dict: 'dates' (tuloksen päivät), 'players' (rosterin järjestyksessä),
+        'games_cumsum' (pelaajat × (päivät + 1) aktiivisista peleistä) sekä
+        'active_cumsum' ja 'fp_cumsum' (päivät + 1 aktiivisista peleistä ja
+        fantasiapisteistä yhteensä).
+    """
+    roster = CompactRoster(roster_df)
+    daily_results = result[0]
+    player_codes = {name: i for i, name in enumerate(roster.names)}
+    active = np.zeros((len(roster), len(daily_results)), dtype=bool)
+    for day, day_result in enumerate(daily_results):
+        for slot_players in day_result['Active'].values():
+            active[[player_codes[name] for name in slot_players], day] = True
+
+    return {
+        'dates': [day_result['Date'] for day_result in daily_results],
+        'players': roster.names,
+        'games_cumsum': prefix_sums(active),
+        'active_cumsum': prefix_sums(active.sum(axis=0)),
+        'fp_cumsum': prefix_sums(roster.sort_fpa @ active)
+    }
+
+def lineup_totals_in_range(lineup_prefix, start_date, end_date):
+    """
+    Palauttaa aikavälin (player_games, kokonais-FP, aktiiviset pelit yhteensä)
+    build_lineup_prefix-etusummista. Arvot ovat samat kuin optimize_roster_advanced
+    antaisi aikavälin aikataululle; kokonais-FP voi erota liukulukujen
+    pyöristyksen verran, koska se lasketaan päiväsummien erotuksena.
+    """
+    lo, hi = get_date_range_codes(lineup_prefix['dates'], start_date, end_date)
+    games = lineup_prefix['games_cumsum']
+    player_games = dict(zip(lineup_prefix['players'], (games[:, hi] - games[:, lo]).tolist()))
+    total_fantasy_points = float(lineup_prefix['fp_cumsum'][hi] - lineup_prefix['fp_cumsum'][lo])
+    total_active_games = int(lineup_prefix['active_cumsum'][hi] - lineup_prefix['active_cumsum'][lo])
+    return player_games, total_fantasy_points, total_active_games
+
+def slice_optimization_result(result, lineup_prefix, start_date, end_date):
+    """
+    Rajaa optimointituloksen aikavälille: päivittäiset kokoonpanot otetaan
+    tuloksesta sellaisenaan ja kokonaismäärät lasketaan etusummista.
+
+    Returns:
+        tuple: Kuten optimize_roster_advanced.
+    """
+    lo, hi = get_date_range_codes(lineup_prefix['dates'], start_date, end_date)
+    return (result[0][lo:hi],) + lineup_totals_in_range(lineup_prefix, start_date, end_date)
+
+# --- PITKÄMUOTOINEN TULOS ---
+# Penkillä olevien pelaajien paikka pitkämuotoisessa tulostaulukossa
+BENCH_SLOT = 'Bench'
+
+def lineup_frame(daily_results, roster_df):
+    """
+    Muuntaa optimize_roster_advanced-tuloksen päivittäiset kokoonpanot
+    pitkämuotoiseksi DataFrameksi, jossa on yksi rivi pelaajaa ja pelipäivää
+    kohden: date, player, slot (kokoonpanopaikka tai BENCH_SLOT), active ja fpa
+    (pelaajan FP/GP rosterista). Rivit ovat samassa järjestyksessä kuin
+    tuloksessa, ja päivät, joina kukaan ei pelaa, puuttuvat taulukosta.
+    """
+    dates, players, slots = [], [], []
+    for day in daily_results:
+        for slot, names in list(day['Active'].items()) + [(BENCH_SLOT, day['Bench'])]:
+            dates.extend([day['Date']] * len(names))
+            players.extend(names)
+            slots.extend([slot] * len(names))
+
+    roster_df = roster_df.drop_duplicates(subset='name', keep='last')
+    if 'fantasy_points_avg' in roster_df.columns:
+        fpa = pd.to_numeric(roster_df['fantasy_points_avg'], errors='coerce')
+    else:
+        fpa = pd.Series(0.0, index=roster_df.index)
+    fpa.index = roster_df['name']
+    slot_order = list(daily_results[0]['Active'].keys()) if daily_results else []
+    slots = np.array(slots, dtype=object)
+
+    return pd.DataFrame({
+        'date': pd.DatetimeIndex(dates),
+        'player': pd.Series(players, dtype=object),
+        'slot': pd.Categorical(slots, categories=slot_order + [BENCH_SLOT]),
+        'active': slots != BENCH_SLOT,
+        'fpa': pd.Series(players, dtype=object).map(fpa).to_numpy(dtype=float)
+    })
+
+def player_totals(lineups, players=None):
+    """
+    Laskee lineup_frame-taulukosta pelaajittain aktiiviset pelit (active_games)
+    ja ennakoidut fantasiapisteet (fantasy_points). Jos players annetaan,
+    tulos on sen järjestyksessä ja pelaajat ilman aktiivisia pelejä saavat nollan.
+    """
+    active = lineups[lineups['active']]
+    totals = active.groupby('player', sort=False).agg(
+        active_games=('active', 'size'),
+        fantasy_points=('fpa', 'sum')
+    )
+    if players is not None:
+        totals = totals.reindex(list(players), fill_value=0)
+    totals.index.name = 'player'
+    return totals
+
+def get_player_fp_distribution(roster_df, player_games):
+    """
+    Palauttaa pelaajien aktiiviset pelit sekä FP:n odotusarvon ja keskihajonnan
+    yhtä peliä kohden NumPy-taulukkoina player_games-sanakirjan järjestyksessä.
+
+    Hajonta luetaan sarakkeesta 'fantasy_points_std' tai 'fantasy_points_var'
+    (varianssi). Jos kumpaakaan ei ole tai arvo puuttuu, keskihajontana käytetään
+    DEFAULT_FP_STD_RATIO × |FP/GP|.
+    """
+    players = roster_df.drop_duplicates(subset='name', keep='last').set_index('name').reindex(list(player_games.keys()))
+    games = np.array(list(player_games.values()), dtype=float)
+    if 'fantasy_points_avg' in players.columns:
+        mean = pd.to_numeric(players['fantasy_points_avg'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    else:
+        mean = np.zeros(len(games))
+
+    std = np.full(len(games), np.nan)
+    if 'fantasy_points_std' in players.columns:
+        std = pd.to_numeric(players['fantasy_points_std'], errors='coerce').to_numpy(dtype=float)
+    elif 'fantasy_points_var' in players.columns:
+        std = np.sqrt(pd.to_numeric(players['fantasy_points_var'], errors='coerce').clip(lower=0).to_numpy(dtype=float))
+    std = np.where(np.isnan(std), DEFAULT_FP_STD_RATIO * np.abs(mean), std)
+    return games, mean, std
+
+@metrics.timed('matchup_simulation')
+def simulate_matchup(my_roster_df, my_player_games, opponent_roster_df, opponent_player_games,
+                     num_simulations=100000, seed=None):
+    """
+    Arvioi ottelun voittotodennäköisyyden Monte Carlo -simulaatiolla.
+
+    Jokainen aktiivinen pelaajapeli on normaalijakautunut pelaajan FP/GP:n ympärillä.
+    Riippumattomien pelien summa on myös normaalijakautunut, joten pelaajan g pelin
+    kokonaispisteet arvotaan suoraan jakaumasta N(g·μ, g·σ²). Simulaatiot
+    lasketaan SIMULATION_CHUNK_SIZE-kokoisina (simulaatiot × pelaajat)
+    -matriisitulon lohkoina, joten arvontamatriisin koko ei kasva simulaatiomäärän mukana.
+
+    Args:
+        my_player_games (dict): Oman joukkueen pelaajien aktiiviset pelit (optimize_roster_advanced).
+        opponent_player_games (dict): Vastustajan pelaajien aktiiviset pelit.
+        num_simulations (int): Simuloitujen otteluiden määrä.
+        seed (int, optional): Satunnaislukugeneraattorin siemen.
+
+    Returns:
+        dict: Voitto-, tasapeli- ja häviötodennäköisyys, pisteeron odotusarvo ja
+            keskihajonta, pisteeron persentiilit sekä kaikki simuloidut pisteerot
+            ('margins', oma joukkue miinus vastustaja).
+    """
+    my_games, my_mean, my_std = get_player_fp_distribution(my_roster_df, my_player_games)
+    opponent_games, opponent_mean, opponent_std = get_player_fp_distribution(opponent_roster_df, opponent_player_games)
+
+    # Vastustajan pelaajat vähentävät pisteeroa
+    expected_margin = my_games @ my_mean - opponent_games @ opponent_mean
+    scales = np.concatenate([np.sqrt(my_games) * my_std, -np.sqrt(opponent_games) * opponent_std])
+    # Pelaajat ilman aktiivisia pelejä tai hajontaa eivät vaikuta jakaumaan
+    scales = scales[scales != 0].astype(np.float32)
+
+    rng = np.random.default_rng(seed)
+    margins = np.empty(num_simulations)
+    for start in range(0, num_simulations, SIMULATION_CHUNK_SIZE):
+        stop = min(start + SIMULATION_CHUNK_SIZE, num_simulations)
+        draws = rng.standard_normal((stop - start, len(scales)), dtype=np.float32)
+        margins[start:stop] = expected_margin + (draws @ scales).astype(float)
+
+    percentiles = [5, 25, 50, 75, 95]
+    return {
+        'win_probability': float(np.mean(margins > 0)),
+        'tie_probability': float(np.mean(margins == 0)),
+        'loss_probability': float(np.mean(margins < 0)),
+        'expected_margin': float(expected_margin),
+        'margin_std': float(margins.std()),
+        'margin_percentiles': dict(zip(percentiles, np.percentile(margins, percentiles).tolist())),
+        'margins': margins
+    }
+
+@metrics.timed('team_impact_simulation')
+def simulate_team_impact(schedule_df, my_roster_df, opponent_roster_df, pos_limits, schedule_index=None,
+                         num_simulations=None):
+    """
+    Simuloi oman ja vastustajan joukkueen suorituskykyä annettujen kokoonpanojen ja pelipäivien perusteella.
+    Palauttaa voittajajoukkueen sekä yksityiskohtaiset tulokset molemmille joukkueille.
+    Jos num_simulations annetaan, tuloksiin lisätään simulate_matchupin voittotodennäköisyys
+    kummankin joukkueen näkökulmasta.
+    """
+    if my_roster_df.empty or opponent_roster_df.empty:
+        return "Täydennä molemmat rosterit ennen simulaatiota.", None, None
+
+    # Suoritetaan optimointi omalle joukkueelle
+    my_daily_results, my_player_games, my_total_points, my_total_games = optimize_roster_advanced(
+        schedule_df, my_roster_df, pos_limits, schedule_index=schedule_index
+    )
+
+    # Suoritetaan optimointi vastustajalle
+    opponent_pos_limits = {
+        'C': 3, 'LW': 3, 'RW': 3, 'D': 4, 'G': 2, 'UTIL': 1
+    }
+    opponent_daily_results, opponent_player_games, opponent_total_points, opponent_total_games = optimize_roster_advanced(
+        schedule_df, opponent_roster_df, opponent_pos_limits, schedule_index=schedule_index
+    )
+
+    # Määrää voittaja
+    if my_total_points > opponent_total_points:
+        winner = "Oma joukkue"
+    elif opponent_total_points > my_total_points:
+        winner = "Vastustaja"
+    else:
+        winner = "Tasapeli"
+        
+    my_results = {
+        "daily_results": my_daily_results,
+        "player_games": my_player_games,
+        "total_points": my_total_points,
+        "total_games": my_total_games
+    }
+    opponent_results = {
+        "daily_results": opponent_daily_results,
+        "player_games": opponent_player_games,
+        "total_points": opponent_total_points,
+        "total_games": opponent_total_games
+    }
+    if num_simulations:
+        matchup = simulate_matchup(
+            my_roster_df, my_player_games, opponent_roster_df, opponent_player_games, num_simulations
+        )
+        my_results["win_probability"] = matchup['win_probability']
+        opponent_results["win_probability"] = matchup['loss_probability']
+
+    # Palautetaan yksityiskohtaiset tulokset
+    return winner, my_results, opponent_results
+
+@metrics.timed('position_availability')
+def calculate_position_availability(schedule_df, roster_df, pos_limits, positions=('C', 'LW', 'RW', 'D', 'G'),
+                                    lineup_cache=None, schedule_index=None):
+    """
+    Laskee jokaiselle pelipäivälle ja pelipaikalle, voiko kokoonpanon aktiivisten
+    pelaajien enimmäismäärä kasvaa yhdellä, jos rosteriin lisätään uusi pelaaja
+    kyseiselle pelipaikalle. Jokainen päivä ratkaistaan vain kerran.
+
+    FP-optimaalinen kokoonpano jättää negatiivisen FP/GP:n pelaajat penkille, joten
+    sen vapaat paikat eivät kerro enimmäismäärästä. Jos rosterissa on tällaisia
+    pelaajia, saatavuus lasketaan kokoonpanoista, joihin on sijoitettu suurin
+    mahdollinen määrä pelaajia (solve_daily_lineup_exact, bench_negative=False).
+
+    Returns:
+        pd.DataFrame: Päivät riveinä, pelipaikat sarakkeina (True = mahtuu).
+    """
+    roster = CompactRoster(roster_df)
+    schedule_index, date_codes, plays = get_roster_plays(roster, schedule_df, schedule_index)
+    if (roster.sort_fpa < 0).any():
+        assignments = [
+            solve_daily_lineup_exact(roster, plays[:, day], pos_limits, bench_negative=False)
+            for day in range(plays.shape[1])
+        ]
+    else:
+        assignments = solve_roster_days(roster, plays, pos_limits, lineup_cache=lineup_cache)
+    slot_options = roster.slot_options(pos_limits)
+    
+    return pd.DataFrame(
+        [find_open_positions(assignment['active'], slot_options, pos_limits, positions) for assignment in assignments],
+        index=[schedule_index['dates'][date_code] for date_code in date_codes],
+        columns=list(positions),
+        dtype=bool
+    )
+
+@metrics.timed('team_impact_by_position')
+def calculate_team_impact_by_position(schedule_df, roster_df, pos_limits, lineup_cache=None, schedule_index=None):
+    """
+    Laskee joukkueiden vaikutukset pelipaikoittain.
+    Palauttaa sanakirjan, jossa avaimina ovat pelipaikat ja arvoina DataFrameja.
+
+    Nykyisen rosterin optimaalinen kokoonpano ratkaistaan kerran jokaiselle päivälle,
+    ja siitä katsotaan, mille pelipaikoille mahtuu vielä uusi pelaaja. Joukkueen
+    lisäpelit ovat niiden päivien määrä, joina joukkue pelaa ja pelipaikalla on tilaa.
+    Tulos on sama kuin jos rosteriin lisättäisiin 0 FP/GP:n pelaaja kustakin joukkueesta.
+    """
+    # Hae kaikki uniikit joukkueet aikataulusta
+    all_teams = sorted(list(set(schedule_df['Home'].tolist() + schedule_df['Visitor'].tolist())))
+    if schedule_index is None:
+        schedule_index = build_schedule_index(schedule_df)
+    positions = ['C', 'LW', 'RW', 'D', 'G']
+    
+    # Päivät × pelipaikat: onko päivän kokoonpanossa tilaa uudelle pelaajalle
+    open_slots = calculate_position_availability(
+        schedule_df, roster_df, pos_limits, positions, lineup_cache=lineup_cache, schedule_index=schedule_index
+    ).to_numpy(dtype=int)
+    
+    # Joukkueet × pelipaikat: pelipäivät, joina pelipaikalla on tilaa
+    date_codes = get_schedule_date_codes(schedule_index, schedule_df)
+    team_games = get_games_matrix(schedule_index, get_team_codes(schedule_index, all_teams), date_codes)
+    extra_games = team_games.astype(int) @ open_slots
+    
+    results = {}
+    for i, pos in enumerate(positions):
+        df = pd.DataFrame({'Joukkue': all_teams, 'Lisäpelit': extra_games[:, i]})
+        results[pos] = df.sort_values('Lisäpelit', ascending=False)
+    
+    return results
+
+@metrics.timed('free_agent_analysis')
+def analyze_free_agents(team_impact_dict, free_agents_df):
+    """
+    Analysoi vapaat agentit aiemmin lasketun joukkueanalyysin perusteella.
+    
+    Args:
+        team_impact_dict (dict): Sanakirja, joka sisältää joukkuekohtaiset lisäpelit.
+        free_agents_df (pd.DataFrame): DataFrame, joka sisältää vapaiden agenttien tiedot.
+            
+    Returns:
+        pd.DataFrame: Lajiteltu DataFrame optimaalisimmista vapaista agenteista. Tyhjä,
+            jos maalivahtien suodatuksen jälkeen ei jää pelaajia.
+
+    Raises:
+        ValueError: Jos joukkueanalyysi tai vapaat agentit puuttuvat.
+    """
+    if not team_impact_dict or free_agents_df.empty:
+        raise ValueError("Joukkueanalyysiä tai vapaiden agenttien listaa ei ole ladattu.")
+
+    # SUODATUS TÄSSÄ: Jätä pois pelaajat, joiden pelipaikka on "G"
+    free_agents_df = free_agents_df[~free_agents_df['positions'].str.contains('G')].copy()
+    if free_agents_df.empty:
+        # Maalivahtien suodatuksen jälkeen ei jäänyt pelaajia
+        return pd.DataFrame()
+        
+    # Yhdistetään joukkueanalyysin tulokset ilman, että välimuistissa olevia DataFrameja muokataan
+    team_impact_df_list = [
+        df.assign(position=pos)
+        for pos, df in team_impact_dict.items()
+        if not df.empty and pos != 'G'  # Myös joukkueanalyysista pois maalivahdit
+    ]
+    
+    if not team_impact_df_list:
+        raise ValueError("Joukkueanalyysin tuloksia ei löytynyt kenttäpelaajille.")
+
+    combined_impact_df = pd.concat(team_impact_df_list, ignore_index=True)
+    combined_impact_df.rename(columns={'Joukkue': 'team', 'Lisäpelit': 'extra_games_total'}, inplace=True)
+    
+    # Joukkue × pelipaikka -taulukko lisäpeleistä
+    extra_games_pivot = combined_impact_df.pivot(index='team', columns='position', values='extra_games_total')
+    extra_games_by_team_pos = extra_games_pivot.stack()
+    
+    results = free_agents_df
+    
+    # Käsittele monipaikkaiset pelaajat: yksi rivi jokaista pelaajan pelipaikkaa kohden
+    exploded = pd.DataFrame({
+        'row': np.arange(len(results)),
+        'team': results['team'].to_numpy(),
+        'position': results['positions'].astype(str).str.replace('/', ',').str.split(',').to_numpy()
+    }).explode('position')
+    exploded['position'] = exploded['position'].str.strip()
+    exploded['extra_games'] = extra_games_by_team_pos.reindex(
+        pd.MultiIndex.from_arrays([exploded['team'], exploded['position']])
+    ).to_numpy()
+    
+    # Paras pelipaikka pelaajaa kohden
+    max_extra_games = exploded['extra_games'].fillna(0).clip(lower=0).groupby(exploded['row']).max().to_numpy()
+    
+    results['games_added'] = max_extra_games.astype(int)
+    results['total_impact'] = max_extra_games * results['fantasy_points_avg']
+    results = results[['name', 'team', 'positions', 'games_added', 'fantasy_points_avg', 'total_impact']]
+    
+    results = results.sort_values(by='total_impact', ascending=False)
+    
+    return results
+    
+@metrics.timed('free_agent_marginal_value')
+def rank_free_agents_by_marginal_value(schedule_df, roster_df, free_agents_df, pos_limits,
+                                       lineup_cache=None, schedule_index=None):
+    """
+    Laskee jokaiselle vapaalle agentille (maalivahdit pois lukien) todellisen
+    muutoksen rosterin kokonaisfantasiapisteisiin, kun pelaaja lisätään rosteriin.
+
+    Nykyisen rosterin päivittäiset optimaaliset kokoonpanot lasketaan kerran. Koska
+    kokoonpanot muodostavat matroidin, pelaajan lisääminen optimaaliseen
+    kokoonpanoon joko mahtuu vapaalle (tai vapautettavalle) paikalle tai syrjäyttää
+    heikoimman siirtoketjun kautta tavoitettavan pelaajan, jos on tätä parempi.
+    Tulos on sama kuin optimize_roster_advanced antaisi pelaaja lisättynä, mutta
+    vain pelaajan joukkueen pelipäivät käsitellään.
+
+    Returns:
+        pd.DataFrame: Samat sarakkeet kuin analyze_free_agents, jossa 'games_added'
+            on pelaajan omat aktiiviset pelit ja 'total_impact' rosterin FP-muutos.
+    """
+    free_agents = free_agents_df[~free_agents_df['positions'].astype(str).str.contains('G')]
+    if free_agents.empty or roster_df.empty:
+        return pd.DataFrame(columns=['name', 'team', 'positions', 'games_added', 'fantasy_points_avg', 'total_impact'])
+
+    roster = CompactRoster(roster_df)
+    schedule_index, date_codes, plays = get_roster_plays(roster, schedule_df, schedule_index)
+    assignments = solve_roster_days(roster, plays, pos_limits, lineup_cache=lineup_cache)
+    slot_options = roster.slot_options(pos_limits)
+
+    # Vapaiden agenttien kelpoisuusmaskit: jokainen eri maski käsitellään kerran päivää kohden
+    fa_masks = np.array([positions_to_mask(positions) for positions in free_agents['positions']], dtype=np.int64)
+    slot_masks, slot_set_codes = np.unique(fa_masks, return_inverse=True)
+
+    slot_sets = [slots_for_mask(mask, pos_limits) for mask in slot_masks]
+
+    has_room = np.zeros((len(slot_sets), len(assignments)), dtype=bool)
+    weakest_fpa = np.full((len(slot_sets), len(assignments)), np.inf)
+    for day, assignment in enumerate(assignments):
+        for k, slots in enumerate(slot_sets):
+            room, weakest = get_replacement_options(
+                slots, assignment['active'], pos_limits, slot_options, roster.sort_fpa
+            )
+            has_room[k, day] = room
+            if not room:
+                weakest_fpa[k, day] = weakest
+
+    fa_fpa = pd.to_numeric(free_agents['fantasy_points_avg'], errors='coerce').fillna(0).to_numpy(dtype=float)[:, None]
+    fa_plays = get_games_matrix(schedule_index, get_team_codes(schedule_index, free_agents['team']), date_codes)
+    room = has_room[slot_set_codes]
+    weakest = weakest_fpa[slot_set_codes]
+
+    # Vapaa paikka: pelaaja tuo koko FP/GP:nsä. Muuten hän korvaa heikoimman, jos on tätä parempi.
+    added = fa_plays & room & (fa_fpa >= 0)
+    replaced = fa_plays & ~room & (fa_fpa > weakest)
+    fp_gain = np.where(added, fa_fpa, 0.0) + np.where(replaced, fa_fpa - np.where(replaced, weakest, 0.0), 0.0)
+
+    results = free_agents[['name', 'team', 'positions', 'fantasy_points_avg']].copy()
+    results['games_added'] = (added | replaced).sum(axis=1)
+    results['total_impact'] = fp_gain.sum(axis=1)
+    results = results[['name', 'team', 'positions', 'games_added', 'fantasy_points_avg', 'total_impact']]
+
+    return results.sort_values(by='total_impact', ascending=False)
+
+@metrics.timed('add_drop_matrix')
+def evaluate_add_drop_matrix(schedule_df, roster_df, candidates_df, drop_names, limits,
+                             lineup_cache=None, schedule_index=None):
+    """
+    Laskee jokaiselle (lisättävä ehdokas, pudotettava pelaaja) -parille rosterin
+    kokonais-FP:n ja aktiivisten pelien muutoksen, kun pelaaja pudotetaan ja ehdokas
+    lisätään tilalle.
+
+    Nykyisen rosterin kokoonpanot ratkaistaan kerran. Pudotuksen vaikutus lasketaan
+    ratkaisemalla uudelleen vain ne päivät, joina pudotettava on aktiivisessa
+    kokoonpanossa; muina päivinä kokoonpano ei muutu. Ehdokkaan lisäys lasketaan
+    näiden kokoonpanojen päälle vaihtosäännöllä kuten rank_free_agents_by_marginal_value,
+    joten ehdokkaiden määrä ei kasvata ratkaistavien päivien määrää.
+
+    Args:
+        candidates_df (pd.DataFrame): Lisättävät pelaajat (name, team, positions, fantasy_points_avg).
+        drop_names (list): Pudotettavien rosteripelaajien nimet.
+
+    Returns:
+        tuple: (fp_delta, games_delta) DataFramet, joissa rivit ovat ehdokkaat ja
+            sarakkeet pudotettavat pelaajat.
+
+    Raises:
+        ValueError: Jos pudotettavaa pelaajaa ei löydy rosterista.
+    """
+    roster = CompactRoster(roster_df)
+    missing = [name for name in drop_names if name not in roster.names]
+    if missing:
+        raise ValueError(f"Pudotettavia pelaajia ei löydy rosterista: {', '.join(missing)}")
+
+    schedule_index, date_codes, plays = get_roster_plays(roster, schedule_df, schedule_index)
+    assignments = solve_roster_days(roster, plays, limits, lineup_cache=lineup_cache)
+    slot_options = roster.slot_options(limits)
+    drop_codes = [roster.names.index(name) for name in drop_names]
+
+    candidate_fpa = pd.to_numeric(candidates_df['fantasy_points_avg'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    candidate_masks = np.array([positions_to_mask(positions) for positions in candidates_df['positions']], dtype=np.int64)
+    slot_masks, mask_codes = np.unique(candidate_masks, return_inverse=True)
+    slot_sets = [slots_for_mask(mask, limits) for mask in slot_masks]
+    candidate_plays = get_games_matrix(
+        schedule_index, get_team_codes(schedule_index, candidates_df['team']), date_codes
+    )
+
+    def lineup_totals(assignment):
+        active = [player for slot_players in assignment['active'].values() for player in slot_players]
+        return roster.sort_fpa[active].sum(), len(active)
+
+    def candidate_gains(assignment, playing):
+        """Ehdokkaiden FP- ja pelimuutos, kun ne lisätään annettuun päivän kokoonpanoon."""
+        room = np.zeros(len(slot_sets), dtype=bool)
+        weakest = np.full(len(slot_sets), np.inf)
+        for k, slots in enumerate(slot_sets):
+            room[k], weakest_fpa = get_replacement_options(
+                slots, assignment['active'], limits, slot_options, roster.sort_fpa
+            )
+            if not room[k]:
+                weakest[k] = weakest_fpa
+        room = room[mask_codes]
+        weakest = weakest[mask_codes]
+        added = playing & room & (candidate_fpa >= 0)
+        replaced = playing & ~room & (candidate_fpa > weakest)
+        fp_gain = np.where(added, candidate_fpa, 0.0) + np.where(replaced, candidate_fpa - np.where(replaced, weakest, 0.0), 0.0)
+        return fp_gain, added.astype(int)
+
+    fp_delta = np.zeros((len(candidates_df), len(drop_codes)))
+    games_delta = np.zeros((len(candidates_df), len(drop_codes)), dtype=int)
+    no_gain = (np.zeros(len(candidates_df)), np.zeros(len(candidates_df), dtype=int))
+
+    for day, assignment in enumerate(assignments):
+        playing = candidate_plays[:, day]
+        base_gain = candidate_gains(assignment, playing) if playing.any() else no_gain
+        active_players = {player for slot_players in assignment['active'].values() for player in slot_players}
+        base_fp, base_games = None, None
+
+        for j, player in enumerate(drop_codes):
+            if player not in active_players:
+                # Penkillä oleva tai pelaamaton pelaaja ei vaikuta päivän kokoonpanoon
+                fp_delta[:, j] += base_gain[0]
+                games_delta[:, j] += base_gain[1]
+                continue
+
+            if base_fp is None:
+                base_fp, base_games = lineup_totals(assignment)
+            available = plays[:, day].copy()
+            available[player] = False
+            if lineup_cache is not None:
+                dropped = solve_daily_lineup_cached(roster, available, limits, lineup_cache)
+            else:
+                dropped = solve_daily_lineup_exact(roster, available, limits)
+            dropped_fp, dropped_games = lineup_totals(dropped)
+            gain = candidate_gains(dropped, playing) if playing.any() else no_gain
+            fp_delta[:, j] += dropped_fp - base_fp + gain[0]
+            games_delta[:, j] += dropped_games - base_games + gain[1]
+
+    index = pd.Index(candidates_df['name'].tolist(), name='Lisättävä')
+    columns = pd.Index(list(drop_names), name='Pudotettava')
+    return (
+        pd.DataFrame(fp_delta, index=index, columns=columns),
+        pd.DataFrame(games_delta, index=index, columns=columns)
+    )
+
+# --- RINNAKKAISET OPTIMOINNIT ---
+# Prosessikohtainen tila: aikataulu, indeksi ja pohjarosteri välitetään prosessille vain kerran
+optimizer_worker_state = {}
+
+def apply_roster_variant(base_roster_df, variant):
+    """
+    Muodostaa rosterivariaation pohjarosterista. Avain 'roster' korvaa pohjarosterin,
+    'drop' poistaa listatut pelaajat nimen perusteella ja 'add' lisää listan pelaajia.
+    """
+    roster_df = variant.get('roster', base_roster_df)
+    if variant.get('drop'):
+        roster_df = roster_df[~roster_df['name'].isin(variant['drop'])]
+    if variant.get('add'):
+        roster_df = pd.concat([roster_df, pd.DataFrame(variant['add'])], ignore_index=True)
+    return roster_df
+
+def init_optimizer_worker(schedule_df, schedule_index, base_roster_df, limits, method, num_attempts,
+                          lineup_cache=None):
+    optimizer_worker_state.update({
+        'schedule': schedule_df,
+        'schedule_index': schedule_index if schedule_index is not None else build_schedule_index(schedule_df),
+        'base_roster': base_roster_df,
+        'limits': limits,
+        'method': method,
+        'num_attempts': num_attempts,
+        'lineup_cache': lineup_cache if lineup_cache is not None else LineupCache()
+    })
+
+def run_optimizer_variant(key, variant):
+    state = optimizer_worker_state
+    roster_df = apply_roster_variant(state['base_roster'], variant)
+    return key, optimize_roster_advanced(
+        state['schedule'], roster_df, state['limits'],
+        num_attempts=state['num_attempts'], method=state['method'],
+        lineup_cache=state['lineup_cache'], schedule_index=state['schedule_index']
+    )
+
+def run_projection_variant(key, variant):
+    state = optimizer_worker_state
+    roster_df = apply_roster_variant(state['base_roster'], variant)
+    return key, project_roster_days(
+        state['schedule'], roster_df, state['limits'],
+        num_attempts=state['num_attempts'], method=state['method'],
+        lineup_cache=state['lineup_cache'], schedule_index=state['schedule_index']
+    )
+
+def run_variants_in_processes(task, schedule_df, base_roster_df, variants, limits, max_workers, method,
+                              num_attempts, schedule_index, lineup_cache=None):
+    """
+    Jakaa variaatiot ProcessPoolExecutorin prosesseille ja palauttaa task-funktion
+    (avain, tulos) -parit valmistumisjärjestyksessä. Aikataulu, indeksi ja
+    pohjarosteri välitetään prosesseille kerran alustuksessa, ja jokainen tehtävä
+    sisältää vain variaation muutokset.
+
+    Muistissa oleva LineupCache on prosessikohtainen, mutta PersistentLineupCache
+    jaetaan prosesseille, jolloin ne lukevat ja täydentävät samaa tietokantaa.
+    """
+    shared_cache = lineup_cache if isinstance(lineup_cache, PersistentLineupCache) else None
+    executor = ProcessPoolExecutor(
+        max_workers=min(max_workers, len(variants)),
+        initializer=init_optimizer_worker,
+        initargs=(schedule_df, schedule_index, base_roster_df, limits, method, num_attempts, shared_cache)
+    )
+    with executor:
+        futures = [executor.submit(task, key, variant) for key, variant in variants.items()]
+        for future in as_completed(futures):
+            yield future.result()
+
+def optimize_roster_variants(schedule_df, base_roster_df, variants, limits, max_workers=1, method='exact',
+                             num_attempts=100, lineup_cache=None, schedule_index=None):
+    """
+    Optimoi toisistaan riippumattomat rosterivariaatiot ja palauttaa (avain, tulos)
+    -parit sitä mukaa kuin ne valmistuvat.
+
+    Kun max_workers > 1, variaatiot jaetaan ProcessPoolExecutorin prosesseille
+    (ks. run_variants_in_processes).
+    """
+    if max_workers <= 1 or len(variants) <= 1:
+        for key, variant in variants.items():
+            roster_df = apply_roster_variant(base_roster_df, variant)
+            yield key, optimize_roster_advanced(
+                schedule_df, roster_df, limits, num_attempts=num_attempts, method=method,
+                lineup_cache=lineup_cache, schedule_index=schedule_index
+            )
+        return
+
+    yield from run_variants_in_processes(
+        run_optimizer_variant, schedule_df, base_roster_df, variants, limits,
+        max_workers, method, num_attempts, schedule_index, lineup_cache
+    )
+
+# --- LIIGAN PROJEKTIO ---
+# Sarake, joka kertoo liigan rosteritaulukossa pelaajan fantasiajoukkueen
+LEAGUE_TEAM_COLUMN = 'fantasy_team'
+
+def split_league_rosters(league_df, team_column=LEAGUE_TEAM_COLUMN):
+    """
+    Jakaa koko liigan rosteritaulukon (yksi rivi pelaajaa kohden) joukkueittain.
+    Nostaa ValueErrorin, jos joukkuesarake tai rosterin sarakkeet puuttuvat.
+    """
+    if team_column not in league_df.columns:
+        raise ValueError(f"Liigan rosteritaulukosta puuttuu sarake '{team_column}'.")
+    league_df = normalize_roster(league_df.copy())
+    return {
+        str(team): roster.drop(columns=team_column).reset_index(drop=True)
+        for team, roster in league_df.groupby(team_column, sort=False)
+    }
+
+def load_league_roster_file(source, name):
+    """
+    Lukee yhden liigan rosteritiedoston. Jos tiedostossa on sarake
+    LEAGUE_TEAM_COLUMN, se jaetaan joukkueittain; muuten koko tiedosto on
+    joukkue nimeltä name.
+    """
+    roster = pd.read_csv(source)
+    if LEAGUE_TEAM_COLUMN in roster.columns:
+        return split_league_rosters(roster)
+    return {name: normalize_roster(roster)}
+
+def add_league_rosters(rosters, new_rosters, source):
+    """
+    Lisää tiedostosta source luetut joukkueet rosters-sanakirjaan.
+    Nostaa ValueErrorin, jos joukkue on jo luettu toisesta tiedostosta.
+    """
+    duplicates = [team for team in new_rosters if team in rosters]
+    if duplicates:
+        raise ValueError(f"Joukkue {', '.join(duplicates)} esiintyy useammassa tiedostossa (viimeksi {source}).")
+    rosters.update(new_rosters)
+
+def load_league_rosters(source):
+    """
+    Lukee liigan rosterit joko hakemistosta, jossa jokainen CSV-tiedosto on yksi
+    joukkue (nimenä tiedoston nimi), tai yhdestä CSV-tiedostosta, jossa sarake
+    LEAGUE_TEAM_COLUMN kertoo joukkueen. Nostaa ValueErrorin, jos sama joukkue
+    esiintyy useammassa tiedostossa.
+    """
+    paths = sorted(glob.glob(os.path.join(source, '*.csv'))) if os.path.isdir(source) else [source]
+    if not paths:
+        raise ValueError(f"Hakemistosta {source} ei löytynyt CSV-tiedostoja.")
+    rosters = {}
+    for path in paths:
+        add_league_rosters(rosters, load_league_roster_file(path, os.path.splitext(os.path.basename(path))[0]), path)
+    return rosters
+
+def project_roster_days(schedule_df, roster_df, limits, num_attempts=100, method='exact',
+                        lineup_cache=None, schedule_index=None):
+    """
+    Laskee rosterin päivittäiset aktiiviset pelit ja ennakoidut fantasiapisteet
+    optimize_roster_advanced-kokoonpanoilla.
+
+    Returns:
+        tuple: (päivät, aktiiviset pelit päivittäin, FP päivittäin) NumPy-taulukkoina.
+    """
+    roster = CompactRoster(roster_df)
+    schedule_index, date_codes, plays = get_roster_plays(roster, schedule_df, schedule_index)
+    assignments = solve_roster_days(roster, plays, limits, num_attempts, method, lineup_cache)
+
+    games = np.zeros(len(assignments), dtype=int)
+    fantasy_points = np.zeros(len(assignments))
+    for day, assignment in enumerate(assignments):
+        active = [player for slot_players in assignment['active'].values() for player in slot_players]
+        games[day] = len(active)
+        fantasy_points[day] = roster.sort_fpa[active].sum()
+    return [schedule_index['dates'][date_code] for date_code in date_codes], games, fantasy_points
+
+@metrics.timed('league_projection')
+def project_league(schedule_df, rosters, limits, max_workers=1, method='exact', num_attempts=100,
+                   lineup_cache=None, schedule_index=None):
+    """
+    Projisoi koko liigan: optimoi jokaisen rosterin samalla aikatauluindeksillä ja
+    palauttaa joukkue × päivä -taulukot aktiivisista peleistä ja fantasiapisteistä.
+    Kun max_workers > 1, rosterit jaetaan prosesseille kuten optimize_roster_variants.
+
+    Args:
+        rosters (dict): Fantasiajoukkueen nimi -> rosteri (DataFrame).
+
+    Returns:
+        tuple: (active_games, fantasy_points) DataFramet, rivit joukkueet ja sarakkeet päivät.
+    """
+    if schedule_index is None:
+        schedule_index = build_schedule_index(schedule_df)
+    variants = {team: {'roster': roster_df} for team, roster_df in rosters.items()}
+
+    if max_workers <= 1 or len(variants) <= 1:
+        results = (
+            (team, project_roster_days(
+                schedule_df, roster_df, limits, num_attempts=num_attempts, method=method,
+                lineup_cache=lineup_cache, schedule_index=schedule_index
+            ))
+            for team, roster_df in rosters.items()
+        )
+    else:
+        results = run_variants_in_processes(
+            run_projection_variant, schedule_df, pd.DataFrame(columns=ROSTER_COLUMNS), variants, limits,
+            max_workers, method, num_attempts, schedule_index, lineup_cache
+        )
+
+    dates = [schedule_index['dates'][date_code] for date_code in get_schedule_date_codes(schedule_index, schedule_df)]
+    active_games = pd.DataFrame(0, index=pd.Index(list(rosters.keys()), name='Joukkue'), columns=dates)
+    fantasy_points = pd.DataFrame(0.0, index=active_games.index, columns=dates)
+    for team, (_, games, team_fp) in results:
+        active_games.loc[team] = games
+        fantasy_points.loc[team] = team_fp
+    return active_games, fantasy_points
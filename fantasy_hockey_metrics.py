@@ -0,0 +1,226 @@
+"""
+Kevyet suorituskykymittarit: vaiheiden ajastukset ja tapahtumalaskurit.
+
+Laskentaydin, Sheets-välimuisti ja käyttöliittymä kirjaavat vaiheidensa kestot
+(esim. aikataulun jäsennys, optimointi, saatavuusmatriisi) ja laskurit (esim.
+ratkaistut päivät, satunnaishaun yritykset, vaihdot, välimuistiosumat)
+moduulitason metrics-olioon. Mittarit ovat oletuksena pois päältä, jolloin
+jokainen kirjaus on pelkkä enabled-lipun tarkistus.
+
+metrics ohjaa kirjaukset kulloinkin aktiivisiin PhaseMetrics-mittareihin, jotka
+asetetaan metrics.activate-kutsulla contextvars-muuttujaan. Aktivointi koskee
+vain kutsuvaa säiettä (ja sen kontekstista käynnistettyjä tehtäviä), joten
+esim. Streamlit-sovelluksen jokaisella istunnolla on omat mittarinsa eivätkä
+istunnot kytke toistensa kirjausta päälle tai pois.
+
+Mittarit eivät siirry prosessien välillä: rinnakkaisten prosessien vaiheet
+eivät näy pääprosessin mittareissa. Sisäkkäiset vaiheet kirjataan kumpikin
+omaan kestoonsa, joten esim. optimointi sisältyy sitä kutsuvan analyysin kestoon.
+
+Yksittäisen toiminnon tarkempaa tutkimista varten ProfileCapture kaappaa
+lohkon cProfile-profiilin.
+"""
+import contextvars
+import cProfile
+import functools
+import json
+import marshal
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Prometheus-mittarien nimien etuliite
+METRIC_PREFIX = 'fantasy_hockey'
+
+# Pois päältä olevien mittarien span palauttaa aina tämän tyhjän kontekstin
+NULL_SPAN = nullcontext()
+
+class PhaseMetrics:
+    """
+    Vaiheiden kestot (kutsut, kokonaisaika, pisin kesto) ja nimetyt laskurit.
+
+    Args:
+        enabled (bool): Kirjataanko mittareita.
+        clock: Aikafunktio (oletuksena time.perf_counter), vaihdettavissa kokeiluja varten.
+    """
+    def __init__(self, enabled=False, clock=time.perf_counter):
+        self.enabled = enabled
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.spans = {}
+        self.counters = {}
+
+    def span(self, name):
+        """Kontekstinhallinta, joka kirjaa lohkon keston vaiheelle name."""
+        if not self.enabled:
+            return NULL_SPAN
+        return self.timing(name)
+
+    @contextmanager
+    def timing(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, self.clock() - start)
+
+    def record(self, name, seconds):
+        with self.lock:
+            span = self.spans.get(name)
+            if span is None:
+                span = self.spans[name] = {'count': 0, 'total_s': 0.0, 'max_s': 0.0}
+            span['count'] += 1
+            span['total_s'] += seconds
+            span['max_s'] = max(span['max_s'], seconds)
+
+    def count(self, name, value=1):
+        """Kasvattaa laskuria name arvolla value."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        with self.lock:
+            self.spans.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """Palauttaa kopion mittareista: {'spans': {...}, 'counters': {...}}."""
+        with self.lock:
+            return {
+                'spans': {name: dict(span) for name, span in self.spans.items()},
+                'counters': dict(self.counters)
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        """Palauttaa mittarit Prometheuksen tekstimuodossa."""
+        snapshot = self.snapshot()
+        lines = []
+        span_metrics = [
+            ('phase_calls_total', 'counter', 'count', "Vaiheen suorituskerrat."),
+            ('phase_seconds_total', 'counter', 'total_s', "Vaiheen kokonaiskesto sekunteina."),
+            ('phase_seconds_max', 'gauge', 'max_s', "Vaiheen pisin yksittäinen kesto sekunteina.")
+        ]
+        for metric, metric_type, field, help_text in span_metrics:
+            name = f"{METRIC_PREFIX}_{metric}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for phase, span in sorted(snapshot['spans'].items()):
+                lines.append(f'{name}{{phase="{escape_label(phase)}"}} {span[field]}')
+        for counter, value in sorted(snapshot['counters'].items()):
+            name = f"{METRIC_PREFIX}_{re.sub(r'[^a-zA-Z0-9_]', '_', counter)}_total"
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+class ContextMetrics:
+    """
+    Moduulitason mittarit, jotka kirjaavat nykyisessä kontekstissa aktiivisiin
+    PhaseMetrics-mittareihin. Ilman aktivointia kirjaukset menevät
+    pois päältä oleviin oletusmittareihin.
+    """
+    def __init__(self):
+        self.default = PhaseMetrics()
+        self.active = contextvars.ContextVar('active_metrics', default=self.default)
+
+    def activate(self, phase_metrics):
+        """Ohjaa nykyisen kontekstin kirjaukset mittareihin phase_metrics."""
+        self.active.set(phase_metrics)
+
+    def current(self):
+        return self.active.get()
+
+    @property
+    def enabled(self):
+        return self.current().enabled
+
+    def span(self, name):
+        return self.current().span(name)
+
+    def timed(self, name):
+        """Koristelija, joka kirjaa funktion keston kutsuhetken aktiivisiin mittareihin."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                target = self.current()
+                if not target.enabled:
+                    return func(*args, **kwargs)
+                start = target.clock()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    target.record(name, target.clock() - start)
+            return wrapper
+        return decorator
+
+    def count(self, name, value=1):
+        self.current().count(name, value)
+
+    def reset(self):
+        self.current().reset()
+
+    def snapshot(self):
+        return self.current().snapshot()
+
+    def to_json(self):
+        return self.current().to_json()
+
+    def to_prometheus(self):
+        return self.current().to_prometheus()
+
+class ProfileCapture:
+    """
+    Kaappaa with-lohkon cProfile-profiilin. Profiloi vain lohkoa suorittavaa
+    säiettä, ja profiloija on päällä vain lohkon ajan.
+    """
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.elapsed = 0.0
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.disable()
+        self.elapsed = time.perf_counter() - self.start
+        return False
+
+    def top_functions(self, limit=30):
+        """
+        Palauttaa limit eniten kumulatiivista aikaa käyttänyttä funktiota riveinä.
+        Tämän moduulin ajastuskääreet jätetään pois, koska ne vain toistaisivat
+        kääritsemiensä funktioiden ajat.
+        """
+        rows = []
+        for (filename, line, name), (_, calls, own_time, cumulative_time, _) in pstats.Stats(self.profiler).stats.items():
+            if filename == __file__:
+                continue
+            location = f"{os.path.basename(filename)}:{line}" if line else filename
+            rows.append({
+                'function': f"{location}({name})",
+                'calls': calls,
+                'own_s': own_time,
+                'cumulative_s': cumulative_time
+            })
+        rows.sort(key=lambda row: row['cumulative_s'], reverse=True)
+        return rows[:limit]
+
+    def to_bytes(self):
+        """Palauttaa profiilin .prof-tiedoston sisältönä (pstats, snakeviz)."""
+        return marshal.dumps(pstats.Stats(self.profiler).stats)
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Laskentaytimen, Sheets-välimuistin ja käyttöliittymän yhteinen kirjauspiste
+metrics = ContextMetrics()
@@ -1,4 +1,3 @@
-
 import streamlit as st
 import datetime
 import pandas as pd
@@ -7,9 +6,52 @@ from datetime import datetime, timedelta
 from collections import defaultdict
 import itertools
 import os
+from contextlib import contextmanager
+from functools import partial
 import gspread
 from google.oauth2.service_account import Credentials
 
+from fantasy_hockey_core import (
+    LEAGUE_TEAM_COLUMN,
+    OptimizationResultCache,
+    PersistentLineupCache,
+    ScheduleFileCache,
+    add_league_rosters,
+    analyze_free_agents,
+    build_lineup_prefix,
+    build_schedule_index,
+    calculate_position_availability,
+    calculate_team_impact_by_position,
+    evaluate_add_drop_matrix,
+    filter_schedule,
+    load_league_roster_file,
+    load_roster_csv,
+    lineup_frame,
+    load_schedule_csv,
+    optimize_roster_variants,
+    optimize_roster_advanced,
+    parse_positions,
+    player_totals,
+    project_league,
+    rank_free_agents_by_marginal_value,
+    simulate_matchup,
+    slice_optimization_result,
+    team_back_to_backs_in_range,
+    team_games_in_range,
+    update_optimization_result,
+)
+from fantasy_hockey_metrics import PhaseMetrics, ProfileCapture, metrics
+from fantasy_hockey_sheets import (
+    DEFAULT_SHEET_TTL,
+    DEFAULT_SOURCE_TIMEOUT,
+    ROSTER_COLUMNS,
+    GspreadSheetFetcher,
+    SheetCache,
+    load_sources,
+    parse_free_agent_columns,
+    parse_roster_records,
+)
+
 # Aseta sivun konfiguraatio
 st.set_page_config(
     page_title="Fantasy Hockey Optimizer Pro",
@@ -22,6 +64,21 @@ st.set_page_config(
 SCHEDULE_FILE = 'nhl_schedule_saved.csv'
 ROSTER_FILE = 'my_roster_saved.csv'
 OPPONENT_ROSTER_FILE = 'opponent_roster_saved.csv'
+# Kaikkien istuntojen ja komentoriviajojen yhteinen kokoonpanovarasto
+LINEUP_STORE_FILE = 'lineup_store.sqlite'
+
+# Optimointialgoritmit: tarkka ratkaisija ja alkuperäinen satunnaistettu haku vertailua varten
+OPTIMIZER_METHODS = {
+    'exact': "Tarkka (deterministinen)",
+    'random': "Satunnaistettu haku",
+}
+
+# Yhdellä painikkeella ladattavat lähteet: session avain -> näytettävä nimi
+SOURCE_LABELS = {
+    'roster': "Oma rosteri",
+    'free_agents': "Vapaat agentit",
+    'opponent_roster': "Vastustajan rosteri",
+}
 
 # Alusta session muuttujat
 if 'schedule' not in st.session_state:
@@ -33,11 +90,24 @@ if 'opponent_roster' not in st.session_state:
 if 'team_impact_results' not in st.session_state:
     st.session_state['team_impact_results'] = None
 
+# Istunnon omat suorituskykymittarit aktivoidaan ennen ensimmäistäkään mitattavaa vaihetta
+if 'session_metrics' not in st.session_state:
+    st.session_state['session_metrics'] = PhaseMetrics()
+st.session_state['session_metrics'].enabled = st.session_state.get('debug_metrics', False)
+metrics.activate(st.session_state['session_metrics'])
+# Profilointi koskee vain seuraavaa toimintoa, joten valinta poistuu sen jälkeen
+if st.session_state.pop('profile_consumed', False):
+    st.session_state['profile_next_action'] = False
+
 # --- GOOGLE SHEETS LATAUSFUNKTIOT ---
 @st.cache_resource
 def get_gspread_client():
     try:
-        scopes = ['https://www.googleapis.com/auth/spreadsheets']
+        # Drive-metatietojen lukuoikeudella välimuisti näkee taulukon muokkausajan
+        scopes = [
+            'https://www.googleapis.com/auth/spreadsheets',
+            'https://www.googleapis.com/auth/drive.metadata.readonly'
+        ]
         creds_json = st.secrets["gcp_service_account"]
         creds = Credentials.from_service_account_info(creds_json, scopes=scopes)
         client = gspread.authorize(creds)
@@ -46,55 +116,50 @@ def get_gspread_client():
         st.error(f"Virhe Google Sheets -tunnistautumisessa. Tarkista secrets.toml-tiedostosi: {e}")
         return None
 
-def load_roster_from_gsheets():
+@st.cache_resource
+def get_sheet_cache():
     client = get_gspread_client()
     if client is None:
+        return None
+    return SheetCache(GspreadSheetFetcher(client), ttl=DEFAULT_SHEET_TTL)
+
+def load_roster_from_gsheets():
+    sheet_cache = get_sheet_cache()
+    if sheet_cache is None:
         return pd.DataFrame()
     try:
         sheet_url = st.secrets["roster_sheet"]["url"]
-        sheet = client.open_by_url(sheet_url).sheet1
-        data = sheet.get_all_records()
-        df = pd.DataFrame(data)
-        if 'fantasy_points_avg' not in df.columns:
-            df['fantasy_points_avg'] = 0.0
-        df['fantasy_points_avg'] = pd.to_numeric(df['fantasy_points_avg'], errors='coerce').fillna(0)
-        return df
+        return sheet_cache.get(sheet_url, parse_roster_records, revalidate=True)
     except Exception as e:
         st.error(f"Virhe Google Sheets -tiedoston lukemisessa: {e}")
         return pd.DataFrame()
 
 def load_free_agents_from_gsheets():
-    client = get_gspread_client()
-    if client is None:
+    sheet_cache = get_sheet_cache()
+    if sheet_cache is None:
         return pd.DataFrame()
     try:
         sheet_url = st.secrets["free_agents_sheet"]["url"]
-        sheet = client.open_by_url(sheet_url).sheet1
-        data = sheet.get_all_records()
-        df = pd.DataFrame(data)
-
-        required_columns = ['name', 'team', 'positions', 'fantasy_points_avg']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            st.error(f"Seuraavat sarakkeet puuttuvat vapaiden agenttien tiedostosta: {', '.join(missing_columns)}")
-            return pd.DataFrame()
-
-        # Muunna 'fantasy_points_avg' numeeriseksi ja täytä puuttuvat arvot nollalla
-        df['fantasy_points_avg'] = pd.to_numeric(df['fantasy_points_avg'], errors='coerce')
-        
-        # Järjestä sarakkeet oikein ennen palautusta
-        df = df[required_columns]
-
-        return df
+        return sheet_cache.get(sheet_url, parse_free_agent_columns, columns=ROSTER_COLUMNS, revalidate=True)
+    except ValueError as e:
+        st.error(str(e))
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"Virhe vapaiden agenttien Google Sheets -tiedoston lukemisessa: {e}")
         return pd.DataFrame()
 
+@st.cache_resource
+def get_schedule_file_cache():
+    return ScheduleFileCache()
+
 # --- SIVUPALKKI: TIEDOSTOJEN LATAUS ---
 st.sidebar.header("📁 Tiedostojen lataus")
 
 if st.sidebar.button("Tyhjennä kaikki välimuisti"):
     st.cache_data.clear()
+    # Kokoonpanovarasto on levyllä, joten resurssin unohtaminen ei yksin tyhjennä sitä
+    PersistentLineupCache(LINEUP_STORE_FILE).clear()
+    st.cache_resource.clear()
     st.session_state['schedule'] = pd.DataFrame()
     st.session_state['roster'] = pd.DataFrame(columns=['name', 'team', 'positions', 'fantasy_points_avg'])
     st.session_state['opponent_roster'] = pd.DataFrame(columns=['name', 'team', 'positions', 'fantasy_points_avg'])
@@ -103,11 +168,11 @@ if st.sidebar.button("Tyhjennä kaikki välimuisti"):
 
 # Peliaikataulun lataus
 schedule_file_exists = False
+schedule_file_cache = get_schedule_file_cache()
 try:
-    st.session_state['schedule'] = pd.read_csv(SCHEDULE_FILE)
-    st.session_state['schedule']['Date'] = pd.to_datetime(st.session_state['schedule']['Date'])
+    st.session_state['schedule'] = schedule_file_cache.load(SCHEDULE_FILE)
     schedule_file_exists = True
-except FileNotFoundError:
+except (FileNotFoundError, ValueError):
     schedule_file_exists = False
 
 if schedule_file_exists and not st.sidebar.button("Lataa uusi aikataulu", key="upload_schedule_button"):
@@ -120,18 +185,64 @@ else:
     )
     if schedule_file is not None:
         try:
-            schedule = pd.read_csv(schedule_file)
-            if not schedule.empty and all(col in schedule.columns for col in ['Date', 'Visitor', 'Home']):
-                schedule['Date'] = pd.to_datetime(schedule['Date'])
-                st.session_state['schedule'] = schedule
-                schedule.to_csv(SCHEDULE_FILE, index=False)
-                st.sidebar.success("Peliaikataulu ladattu ja tallennettu!")
-                st.rerun()
-            else:
-                st.sidebar.error("Peliaikataulun CSV-tiedoston tulee sisältää sarakkeet: Date, Visitor, Home")
+            schedule = load_schedule_csv(schedule_file)
+            st.session_state['schedule'] = schedule_file_cache.save(schedule, SCHEDULE_FILE)
+            st.sidebar.success("Peliaikataulu ladattu ja tallennettu!")
+            st.rerun()
+        except ValueError as e:
+            st.sidebar.error(str(e))
         except Exception as e:
             st.sidebar.error(f"Virhe peliaikataulun lukemisessa: {str(e)}")
 
+# Kaikkien lähteiden lataus kerralla: taulukot ja tallennettu vastustajan rosteri ladataan rinnakkain
+st.sidebar.subheader("Lataa kaikki lähteet")
+if st.sidebar.button(
+    "Lataa kaikki lähteet",
+    key="load_all_sources_button",
+    help="Lataa oman rosterin ja vapaiden agenttien taulukot sekä tallennetun vastustajan rosterin yhtä aikaa."
+):
+    source_results = {}
+    source_loaders = {}
+    sheet_cache = get_sheet_cache()
+    for source, secret_name, parse, columns in [
+        ('roster', 'roster_sheet', parse_roster_records, None),
+        ('free_agents', 'free_agents_sheet', parse_free_agent_columns, ROSTER_COLUMNS)
+    ]:
+        try:
+            sheet_url = st.secrets[secret_name]["url"]
+        except Exception:
+            source_results[source] = {'data': None, 'error': f"Taulukon osoite puuttuu ({secret_name})", 'seconds': 0.0}
+            continue
+        if sheet_cache is None:
+            source_results[source] = {'data': None, 'error': "Google Sheets -yhteys puuttuu", 'seconds': 0.0}
+            continue
+        source_loaders[source] = partial(sheet_cache.get, sheet_url, parse, columns=columns, revalidate=True)
+    if os.path.exists(OPPONENT_ROSTER_FILE):
+        source_loaders['opponent_roster'] = partial(load_roster_csv, OPPONENT_ROSTER_FILE)
+
+    with st.spinner("Ladataan lähteitä..."):
+        source_results.update(load_sources(source_loaders, timeout=DEFAULT_SOURCE_TIMEOUT))
+
+    source_report = []
+    for source, result in source_results.items():
+        error = result['error']
+        if error is None and result['data'].empty:
+            error = "Lähde on tyhjä"
+        if error is None:
+            st.session_state[source] = result['data']
+            if source == 'roster':
+                result['data'].to_csv(ROSTER_FILE, index=False)
+        source_report.append({
+            'Lähde': SOURCE_LABELS[source],
+            'Tila': "OK" if error is None else error,
+            'Aika (s)': round(result['seconds'], 2)
+        })
+    st.session_state['source_load_report'] = source_report
+    st.rerun()
+
+if st.session_state.get('source_load_report'):
+    st.sidebar.dataframe(pd.DataFrame(st.session_state['source_load_report']), hide_index=True)
+
 # Rosterin lataus
 st.sidebar.subheader("Lataa oma rosteri")
 if st.sidebar.button("Lataa rosteri Google Sheetsistä", key="roster_button"):
@@ -298,320 +409,97 @@ pos_limits = {
     'UTIL': util_limit
 }
 
-# --- PÄÄSIVU: OPTIMOINTIFUNKTIO ---
-def optimize_roster_advanced(schedule_df, roster_df, limits, num_attempts=100):
-    players_info = {}
-    for _, player in roster_df.iterrows():
-        positions_str = player['positions']
-        if pd.isna(positions_str):
-            positions_list = []
-        elif isinstance(positions_str, str):
-            # Korjattu rivi, joka käsittelee sekä '/' että ',' erottimia
-            positions_list = [p.strip() for p in positions_str.replace(',', '/').split('/')]
-        else:
-            positions_list = positions_str
-        
-        players_info[player['name']] = {
-            'team': player['team'],
-            'positions': positions_list,
-            'fpa': player.get('fantasy_points_avg', 0)
-        }
-    
-    daily_results = []
-    player_games = {name: 0 for name in players_info.keys()}
-    
-    all_dates = sorted(schedule_df['Date'].unique())
-    
-    for date in all_dates:
-        day_games = schedule_df[schedule_df['Date'] == date]
-        
-        available_players_teams = {game['Visitor'] for _, game in day_games.iterrows()} | {game['Home'] for _, game in day_games.iterrows()}
-        available_players_set = {
-            player_name for player_name, info in players_info.items() if info['team'] in available_players_teams
-        }
-        
-        available_players = [
-            {'name': name, 'team': players_info[name]['team'], 'positions': players_info[name]['positions'], 'fpa': players_info[name]['fpa']}
-            for name in available_players_set
-        ]
-        
-        best_assignment = None
-        best_assignment_fp = -1.0
-        
-        for attempt in range(num_attempts):
-            shuffled_players = available_players.copy()
-            np.random.shuffle(shuffled_players)
-            
-            active = {pos: [] for pos in limits.keys()}
-            bench = []
-            
-            for player_info in shuffled_players:
-                placed = False
-                player_name = player_info['name']
-                positions_list = player_info['positions']
-                
-                # Sijoita ensin ensisijaisille paikoille
-                for pos in positions_list:
-                    if pos in limits and len(active[pos]) < limits[pos]:
-                        active[pos].append(player_name)
-                        placed = True
-                        break
-                
-                # Jos ei sijoitettu, yritä UTIL-paikkaa
-                if not placed and 'UTIL' in limits and len(active['UTIL']) < limits['UTIL']:
-                    # Tarkista, että pelaaja voi pelata UTIL-paikalla (ei G)
-                    if any(pos in ['C', 'LW', 'RW', 'D'] for pos in positions_list):
-                        active['UTIL'].append(player_name)
-                        placed = True
-                
-                if not placed:
-                    bench.append(player_name)
-            
-            # Optimointi: vaihda penkillä olevia parempia pelaajia heikompien tilalle
-            improved = True
-            while improved:
-                improved = False
-                
-                bench_copy = sorted(bench, key=lambda name: players_info[name]['fpa'], reverse=True)
-                
-                for bench_player_name in bench_copy:
-                    bench_player_fpa = players_info[bench_player_name]['fpa']
-                    bench_player_positions = players_info[bench_player_name]['positions']
-                    
-                    swapped = False
-                    for active_pos, active_players in active.items():
-                        # Järjestä aktiiviset pelaajat FP/GP:n mukaan
-                        active_sorted = sorted([(name, i) for i, name in enumerate(active_players)], key=lambda x: players_info[x[0]]['fpa'])
-                        
-                        for active_player_name, active_idx in active_sorted:
-                            active_player_fpa = players_info[active_player_name]['fpa']
-
-                            # Tarkista, voidaanko tehdä parantava vaihto
-                            if (
-                                bench_player_fpa > active_player_fpa and 
-                                active_pos in bench_player_positions
-                            ):
-                                active_players[active_idx] = bench_player_name
-                                bench.remove(bench_player_name)
-                                bench.append(active_player_name)
-                                improved = True
-                                swapped = True
-                                break
-                        if swapped:
-                            break
-                    if swapped:
-                        break
-
-            # Laske nykyisen kokoonpanon pisteet
-            current_fp = sum(
-                players_info[player_name]['fpa']
-                for players in active.values()
-                for player_name in players
-            )
-            
-            if current_fp > best_assignment_fp:
-                best_assignment_fp = current_fp
-                best_assignment = {
-                    'active': {pos: players[:] for pos, players in active.items()},
-                    'bench': bench[:]
-                }
-            
-            elif current_fp == best_assignment_fp and best_assignment:
-                current_active_count = sum(len(players) for players in active.values())
-                best_active_count = sum(len(players) for players in best_assignment['active'].values())
-                if current_active_count > best_active_count:
-                    best_assignment = {
-                        'active': {pos: players[:] for pos, players in active.items()},
-                        'bench': bench[:]
-                    }
+st.sidebar.subheader("Optimointialgoritmi")
+optimizer_method = st.sidebar.selectbox(
+    "Kokoonpanon ratkaisija",
+    list(OPTIMIZER_METHODS.keys()),
+    format_func=lambda method: OPTIMIZER_METHODS[method],
+    key="optimizer_method",
+    help="Tarkka ratkaisija löytää jokaiselle päivälle optimaalisen kokoonpanon. Satunnaistettu haku on alkuperäinen algoritmi vertailua varten."
+)
 
-        if best_assignment is None:
-            best_assignment = {
-                'active': {pos: [] for pos in limits.keys()},
-                'bench': [p['name'] for p in available_players]
-            }
-            
-        daily_results.append({
-            'Date': date.date(),
-            'Active': best_assignment['active'],
-            'Bench': best_assignment['bench']
-        })
-        
-        for pos, players in best_assignment['active'].items():
-            for player_name in players:
-                player_games[player_name] += 1
-    
-    total_fantasy_points = sum(
-        player_games[name] * players_info[name]['fpa'] for name in players_info
-    )
-    
-    total_active_games = sum(player_games.values())
+st.sidebar.subheader("Rinnakkaisuus")
+parallel_workers = st.sidebar.number_input(
+    "Rinnakkaiset prosessit",
+    min_value=1,
+    max_value=os.cpu_count() or 1,
+    value=1,
+    key="parallel_workers",
+    help="Yli 1 jakaa vertailujen toisistaan riippumattomat optimoinnit useille prosessoriytimille."
+)
 
-    return daily_results, player_games, total_fantasy_points, total_active_games
+st.sidebar.subheader("Vianetsintä")
+st.sidebar.checkbox(
+    "Suorituskykymittarit",
+    key="debug_metrics",
+    help="Kirjaa vaiheiden kestot ja laskurit ja näyttää ne sivupalkin lopussa. Mittarit ovat istuntokohtaiset."
+)
+st.sidebar.checkbox(
+    "Profiloi seuraava toiminto",
+    key="profile_next_action",
+    help="Ajaa seuraavan analyysin tai vertailun cProfilella ja näyttää eniten aikaa vieneet funktiot sivupalkin lopussa."
+)
 
-def simulate_team_impact(schedule_df, my_roster_df, opponent_roster_df, pos_limits):
-    """
-    Simuloi oman ja vastustajan joukkueen suorituskykyä annettujen kokoonpanojen ja pelipäivien perusteella.
-    Palauttaa voittajajoukkueen sekä yksityiskohtaiset tulokset molemmille joukkueille.
-    """
-    if my_roster_df.empty or opponent_roster_df.empty:
-        return "Täydennä molemmat rosterit ennen simulaatiota.", None, None
+# --- AIKATAULUINDEKSI ---
+@st.cache_data
+def get_schedule_index(schedule_df):
+    return build_schedule_index(schedule_df)
 
-    # Suoritetaan optimointi omalle joukkueelle
-    my_daily_results, my_player_games, my_total_points, my_total_games = optimize_roster_advanced(
-        schedule_df, my_roster_df, pos_limits
-    )
+@st.cache_resource
+def get_lineup_cache():
+    return PersistentLineupCache(LINEUP_STORE_FILE)
 
-    # Suoritetaan optimointi vastustajalle
-    opponent_pos_limits = {
-        'C': 3, 'LW': 3, 'RW': 3, 'D': 4, 'G': 2, 'UTIL': 1
-    }
-    opponent_daily_results, opponent_player_games, opponent_total_points, opponent_total_games = optimize_roster_advanced(
-        schedule_df, opponent_roster_df, opponent_pos_limits
-    )
+@st.cache_resource
+def get_optimization_result_cache():
+    return OptimizationResultCache()
 
-    # Määrää voittaja
-    if my_total_points > opponent_total_points:
-        winner = "Oma joukkue"
-    elif opponent_total_points > my_total_points:
-        winner = "Vastustaja"
-    else:
-        winner = "Tasapeli"
-        
-    # Palautetaan yksityiskohtaiset tulokset
-    return winner, {
-        "daily_results": my_daily_results,
-        "player_games": my_player_games,
-        "total_points": my_total_points,
-        "total_games": my_total_games
-    }, {
-        "daily_results": opponent_daily_results,
-        "player_games": opponent_player_games,
-        "total_points": opponent_total_points,
-        "total_games": opponent_total_games
-    }
-
-def calculate_team_impact_by_position(schedule_df, roster_df, pos_limits):
-    """
-    Laskee joukkueiden vaikutukset pelipaikoittain.
-    Palauttaa sanakirjan, jossa avaimina ovat pelipaikat ja arvoina DataFrameja.
-    """
-    # Hae kaikki uniikit joukkueet aikataulusta
-    all_teams = sorted(list(set(schedule_df['Home'].tolist() + schedule_df['Visitor'].tolist())))
-    
-    # Alustetaan tulokset jokaiselle pelipaikalle
+# --- PÄÄSIVU: KÄYTTÖLIITTYMÄ ---
+lineup_cache = get_lineup_cache()
+optimization_result_cache = get_optimization_result_cache()
+schedule_index = get_schedule_index(st.session_state['schedule']) if not st.session_state['schedule'].empty else None
+
+@contextmanager
+def profile_action(label):
+    """Profiloi painikkeella käynnistetyn toiminnon, jos profilointi on valittu sivupalkista."""
+    if not st.session_state.get('profile_next_action', False):
+        yield
+        return
+    capture = ProfileCapture()
+    try:
+        with capture:
+            yield
+    finally:
+        st.session_state['last_profile'] = {
+            'label': label,
+            'elapsed': capture.elapsed,
+            'top': capture.top_functions(),
+            'data': capture.to_bytes()
+        }
+        st.session_state['profile_consumed'] = True
+
+def player_totals_table(daily_results, roster_df, player_games):
+    """Pelaajien aktiiviset pelit ja ennakoidut FP taulukkona, suurimmat pisteet ensin."""
+    totals = player_totals(lineup_frame(daily_results, roster_df), player_games)
+    return pd.DataFrame({
+        'Pelaaja': totals.index,
+        'Aktiiviset pelit': totals['active_games'].to_numpy(),
+        'Ennakoidut FP': totals['fantasy_points'].round(2).to_numpy()
+    }).sort_values(by='Ennakoidut FP', ascending=False)
+
+def run_roster_variants(schedule_df, base_roster_df, variants, labels):
+    """Ajaa rosterivariaatiot sivupalkin rinnakkaisuusasetuksella ja näyttää edistymisen."""
+    progress = st.progress(0.0, text="Optimoidaan rostereita...")
     results = {}
-    
-    # Käydään läpi jokainen pelipaikka
-    for pos in ['C', 'LW', 'RW', 'D', 'G']:
-        impact_data = []
-        
-        # Käydään läpi jokainen joukkue
-        for team in all_teams:
-            # Luodaan simuloitu pelaaja tälle joukkueelle ja pelipaikalle
-            sim_player = pd.DataFrame({
-                'name': [f'SIM_{team}_{pos}'],
-                'team': [team],
-                'positions': [pos],
-                'fantasy_points_avg': [0.0]
-            })
-            
-            # Yhdistetään simuloitu pelaaja nykyiseen rosteriin
-            sim_roster = pd.concat([roster_df, sim_player], ignore_index=True)
-            
-            # Suoritetaan optimointi
-            _, player_games, _, _ = optimize_roster_advanced(
-                schedule_df, sim_roster, pos_limits, num_attempts=50
-            )
-            
-            # Lasketaan kuinka monta peliä simuloitu pelaaja sai
-            sim_games = player_games.get(f'SIM_{team}_{pos}', 0)
-            
-            impact_data.append({
-                'Joukkue': team,
-                'Lisäpelit': sim_games
-            })
-        
-        # Luodaan DataFrame ja järjestetään se
-        df = pd.DataFrame(impact_data).sort_values('Lisäpelit', ascending=False)
-        results[pos] = df
-    
+    for done, (key, result) in enumerate(optimize_roster_variants(
+        schedule_df, base_roster_df, variants, pos_limits,
+        max_workers=parallel_workers, method=optimizer_method,
+        lineup_cache=lineup_cache, schedule_index=schedule_index
+    ), start=1):
+        results[key] = result
+        progress.progress(done / len(variants), text=f"Valmis: {labels[key]} ({done}/{len(variants)})")
+    progress.empty()
     return results
 
-def analyze_free_agents(team_impact_dict, free_agents_df):
-    """
-    Analysoi vapaat agentit aiemmin lasketun joukkueanalyysin perusteella.
-    
-    Args:
-        team_impact_dict (dict): Sanakirja, joka sisältää joukkuekohtaiset lisäpelit.
-        free_agents_df (pd.DataFrame): DataFrame, joka sisältää vapaiden agenttien tiedot.
-            
-    Returns:
-        pd.DataFrame: Lajiteltu DataFrame optimaalisimmista vapaista agenteista.
-    """
-    if not team_impact_dict or free_agents_df.empty:
-        st.warning("Joukkueanalyysiä tai vapaiden agenttien listaa ei ole ladattu.")
-        return pd.DataFrame()
-
-    # SUODATUS TÄSSÄ: Jätä pois pelaajat, joiden pelipaikka on "G"
-    free_agents_df = free_agents_df[~free_agents_df['positions'].str.contains('G')].copy()
-    if free_agents_df.empty:
-        st.info("Vapaita agentteja ei löytynyt maalivahtien suodatuksen jälkeen.")
-        return pd.DataFrame()
-        
-    team_impact_df_list = []
-    for pos, df in team_impact_dict.items():
-        if not df.empty and pos != 'G':  # Myös joukkueanalyysista pois maalivahdit
-            df['position'] = pos
-            team_impact_df_list.append(df)
-    
-    if not team_impact_df_list:
-        st.warning("Joukkueanalyysin tuloksia ei löytynyt kenttäpelaajille.")
-        return pd.DataFrame()
-
-    combined_impact_df = pd.concat(team_impact_df_list, ignore_index=True)
-    combined_impact_df.rename(columns={'Joukkue': 'team', 'Lisäpelit': 'extra_games_total'}, inplace=True)
-    
-    results = free_agents_df.copy()
-    results['total_impact'] = 0.0
-    results['games_added'] = 0.0
-    
-    # MUUTOS TÄSSÄ
-    # Käsittele monipaikkaiset pelaajat
-    results['positions_list'] = results['positions'].apply(lambda x: [p.strip() for p in str(x).replace('/', ',').split(',')])
-
-    def calculate_impact(row):
-        team = row['team']
-        fpa = row['fantasy_points_avg']
-        positions = row['positions_list']
-        
-        max_extra_games = 0.0
-        
-        if not positions:
-            return 0.0, 0.0
-        
-        for pos in positions:
-            match = combined_impact_df[(combined_impact_df['team'] == team) & (combined_impact_df['position'] == pos)]
-            if not match.empty:
-                extra_games = match['extra_games_total'].iloc[0]
-                if extra_games > max_extra_games:
-                    max_extra_games = extra_games
-        
-        total_impact = max_extra_games * fpa
-        return total_impact, max_extra_games
-
-    results[['total_impact', 'games_added']] = results.apply(calculate_impact, axis=1, result_type='expand')
-
-    results['games_added'] = results['games_added'].astype(int)
-
-    results.drop(columns=['positions_list'], inplace=True)
-    results = results[['name', 'team', 'positions', 'games_added', 'fantasy_points_avg', 'total_impact']]
-    
-    results = results.sort_values(by='total_impact', ascending=False)
-    
-    return results
-    
-# --- PÄÄSIVU: KÄYTTÖLIITTYMÄ ---
 tab1, tab2 = st.tabs(["Rosterin optimointi", "Joukkuevertailu"])
 
 with tab1:
@@ -629,6 +517,17 @@ with tab1:
         st.subheader("Joukkueiden jakauma")
         team_counts = st.session_state['roster']['team'].value_counts()
         st.bar_chart(team_counts)
+        if schedule_index is not None and start_date <= end_date:
+            # Pelimäärät luetaan aikatauluindeksin etusummista, joten aikavälin muutos ei vaadi uutta laskentaa
+            st.dataframe(pd.DataFrame({
+                'Pelaajia': team_counts.to_numpy(),
+                'Pelit aikavälillä': team_games_in_range(
+                    schedule_index, start_date, end_date, team_counts.index
+                ).to_numpy(),
+                'Back-to-back': team_back_to_backs_in_range(
+                    schedule_index, start_date, end_date, team_counts.index
+                ).to_numpy()
+            }, index=team_counts.index.rename('Joukkue')), use_container_width=True)
     
     st.header("🚀 Rosterin optimointi")
     
@@ -637,42 +536,83 @@ with tab1:
     elif start_date > end_date:
         st.warning("Korjaa päivämääräväli niin että aloituspäivä on ennen loppupäivää")
     else:
-        schedule_filtered = st.session_state['schedule'][
-            (st.session_state['schedule']['Date'] >= pd.to_datetime(start_date)) &
-            (st.session_state['schedule']['Date'] <= pd.to_datetime(end_date))
-        ]
+        schedule_filtered = filter_schedule(st.session_state['schedule'], start_date, end_date)
         
         if schedule_filtered.empty:
             st.warning("Ei pelejä valitulla aikavälillä")
         else:
-            with st.spinner("Optimoidaan rosteria älykkäällä algoritmilla..."):
-                daily_results, total_games, total_fp, total_active_games = optimize_roster_advanced(
-                    schedule_filtered, 
-                    st.session_state['roster'], 
-                    pos_limits
-                )
+            # Tarkka ratkaisija ratkaisee päivät toisistaan riippumatta, joten koko aikataulu
+            # optimoidaan kerran ja aikavälin tulos rajataan siitä etusummilla
+            if optimizer_method == 'exact':
+                optimization_schedule = st.session_state['schedule']
+                optimization_start, optimization_end = None, None
+            else:
+                optimization_schedule = schedule_filtered
+                optimization_start, optimization_end = start_date, end_date
+            # Muuttumattomilla syötteillä tulos haetaan välimuistista eikä optimointia ajeta uudelleen
+            optimization_key = OptimizationResultCache.make_key(
+                optimization_schedule, st.session_state['roster'], pos_limits,
+                method=optimizer_method, start_date=optimization_start, end_date=optimization_end
+            )
+            # Rosterin muokkauksen jälkeen ratkaistaan uudelleen vain muuttuneiden pelaajien pelipäivät
+            optimization_context = optimization_key[:1] + optimization_key[2:]
+            previous_optimization = st.session_state.get('last_optimization')
+            optimization_result = optimization_result_cache.get(optimization_key)
+            if optimization_result is None:
+                with st.spinner("Optimoidaan rosteria älykkäällä algoritmilla..."):
+                    if previous_optimization is not None and previous_optimization['context'] == optimization_context:
+                        optimization_result = update_optimization_result(
+                            optimization_schedule,
+                            previous_optimization['roster'],
+                            st.session_state['roster'],
+                            pos_limits,
+                            previous_optimization['result'],
+                            method=optimizer_method,
+                            lineup_cache=lineup_cache,
+                            schedule_index=schedule_index
+                        )
+                    else:
+                        optimization_result = optimize_roster_advanced(
+                            optimization_schedule,
+                            st.session_state['roster'], 
+                            pos_limits,
+                            method=optimizer_method,
+                            lineup_cache=lineup_cache,
+                            schedule_index=schedule_index
+                        )
+                optimization_result_cache.put(optimization_key, optimization_result)
+            lineup_prefix = None
+            if optimizer_method == 'exact':
+                if previous_optimization is not None and previous_optimization['result'] is optimization_result:
+                    lineup_prefix = previous_optimization['prefix']
+                else:
+                    lineup_prefix = build_lineup_prefix(optimization_result, st.session_state['roster'])
+            st.session_state['last_optimization'] = {
+                'context': optimization_context,
+                'roster': st.session_state['roster'],
+                'result': optimization_result,
+                'prefix': lineup_prefix
+            }
+            if lineup_prefix is not None:
+                optimization_result = slice_optimization_result(optimization_result, lineup_prefix, start_date, end_date)
+            daily_results, total_games, total_fp, total_active_games = optimization_result
             
-            st.subheader("Päivittäiset aktiiviset rosterit")
-            daily_data = []
-            for result in daily_results:
-                active_list = []
-                if isinstance(result, dict) and 'Active' in result and result['Active'] is not None:
-                    for pos, players in result['Active'].items():
-                        for player in players:
-                            active_list.append(f"{player} ({pos})")
-                
-                bench_list = []
-                if isinstance(result, dict) and 'Bench' in result and result['Bench'] is not None:
-                    bench_list = result['Bench']
-                
-                daily_data.append({
-                    'Päivä': result['Date'] if isinstance(result, dict) and 'Date' in result else None,
-                    'Aktiiviset pelaajat': ", ".join(active_list),
-                    'Penkki': ", ".join(bench_list) if bench_list else "Ei pelaajia penkille"
+            with metrics.span('render_daily_lineups'):
+                st.subheader("Päivittäiset aktiiviset rosterit")
+                lineups = lineup_frame(daily_results, st.session_state['roster'])
+                active_rows = lineups[lineups['active']]
+                bench_rows = lineups[~lineups['active']]
+                active_text = (active_rows['player'] + ' (' + active_rows['slot'].astype(str) + ')').groupby(
+                    active_rows['date'], sort=False
+                ).agg(", ".join)
+                bench_text = bench_rows['player'].groupby(bench_rows['date'], sort=False).agg(", ".join)
+                result_dates = pd.DatetimeIndex([result['Date'] for result in daily_results])
+                daily_df = pd.DataFrame({
+                    'Päivä': result_dates.date,
+                    'Aktiiviset pelaajat': active_text.reindex(result_dates, fill_value="").to_numpy(),
+                    'Penkki': bench_text.reindex(result_dates, fill_value="Ei pelaajia penkille").to_numpy()
                 })
-            
-            daily_df = pd.DataFrame(daily_data)
-            st.dataframe(daily_df, use_container_width=True)
+                st.dataframe(daily_df, use_container_width=True)
             
             st.subheader("Pelaajien kokonaispelimäärät")
             games_df = pd.DataFrame({
@@ -698,20 +638,13 @@ with tab1:
                 st.dataframe(top_players)
             
             with col2:
-                position_data = {}
-                for _, row in st.session_state['roster'].iterrows():
-                    positions = row['positions'].split('/')
-                    for pos in positions:
-                        pos_clean = pos.strip()
-                        if pos_clean in ['C', 'LW', 'RW', 'D', 'G']:
-                            if pos_clean not in position_data:
-                                position_data[pos_clean] = 0
-                            position_data[pos_clean] += total_games.get(row['name'], 0)
-                
-                pos_df = pd.DataFrame({
-                    'Pelipaikka': list(position_data.keys()),
-                    'Pelit': list(position_data.values())
-                })
+                roster_positions = st.session_state['roster'][['name']].assign(
+                    Pelipaikka=st.session_state['roster']['positions'].map(parse_positions)
+                ).explode('Pelipaikka')
+                roster_positions = roster_positions[roster_positions['Pelipaikka'].isin(['C', 'LW', 'RW', 'D', 'G'])]
+                pos_df = roster_positions.assign(
+                    Pelit=roster_positions['name'].map(total_games).fillna(0).astype(int)
+                ).groupby('Pelipaikka', sort=False, as_index=False)['Pelit'].sum()
                 st.write("Pelipaikkojen kokonaispelimäärät")
                 st.dataframe(pos_df)
 
@@ -720,85 +653,28 @@ with tab1:
 
     if st.session_state['schedule'].empty or st.session_state['roster'].empty:
         st.warning("Lataa sekä peliaikataulu että rosteri näyttääksesi matriisin.")
+    elif start_date > end_date:
+        st.warning("Korjaa päivämääräväli niin että aloituspäivä on ennen loppupäivää")
     else:
-        time_delta = end_date - start_date
-        if time_delta.days > 30:
-            st.info("Päivittäinen saatavuusmatriisi näytetään vain enintään 30 päivän aikavälillä.")
-        else:
-            players_info_dict = {}
-            for _, row in st.session_state['roster'].iterrows():
-                positions_list = [p.strip() for p in row['positions'].split('/')]
-                players_info_dict[row['name']] = {'team': row['team'], 'positions': positions_list, 'fpa': row.get('fantasy_points_avg', 0)}
-
-            def get_daily_active_slots(players_list, pos_limits):
-                best_active_players_count = 0
-                num_attempts = 50
-                
-                for _ in range(num_attempts):
-                    shuffled_players = players_list.copy()
-                    np.random.shuffle(shuffled_players)
-                    active = {pos: [] for pos in pos_limits.keys()}
-                    
-                    for player_name in shuffled_players:
-                        placed = False
-                        positions = players_info_dict.get(player_name, {}).get('positions', [])
-                        for pos in positions:
-                            if pos in pos_limits and len(active[pos]) < pos_limits[pos] and pos != 'UTIL':
-                                active[pos].append(player_name)
-                                placed = True
-                                break
-                        if not placed and 'UTIL' in pos_limits and len(active['UTIL']) < pos_limits['UTIL'] and any(p in ['C', 'LW', 'RW', 'D'] for p in positions):
-                            active['UTIL'].append(player_name)
-                    
-                    current_active_count = sum(len(p) for p in active.values())
-                    if current_active_count > best_active_players_count:
-                        best_active_players_count = current_active_count
-                
-                return best_active_players_count
-                
-            positions_to_show = ['C', 'LW', 'RW', 'D', 'G']
-            availability_data = {pos: [] for pos in positions_to_show}
-            dates = [start_date + timedelta(days=i) for i in range(time_delta.days + 1)]
-            valid_dates = []
-
-            for date in dates:
-                day_games = st.session_state['schedule'][st.session_state['schedule']['Date'].dt.date == date]
-                
-                if day_games.empty:
-                    continue
-
-                available_players_today = [
-                    player_name for player_name, info in players_info_dict.items()
-                    if info['team'] in day_games['Visitor'].tolist() or info['team'] in day_games['Home'].tolist()
-                ]
-
-                valid_dates.append(date)
-
-                for pos_check in positions_to_show:
-                    sim_player_name = f'SIM_PLAYER_{pos_check}'
-                    
-                    sim_players_list = available_players_today + [sim_player_name]
-                    players_info_dict[sim_player_name] = {'team': 'TEMP', 'positions': [pos_check], 'fpa': 0}
-                    if pos_check in ['C', 'LW', 'RW', 'D']:
-                        players_info_dict[sim_player_name]['positions'].append('UTIL')
-
-                    original_active_count = get_daily_active_slots(available_players_today, pos_limits)
-                    simulated_active_count = get_daily_active_slots(sim_players_list, pos_limits)
-                    
-                    can_fit = simulated_active_count > original_active_count
-                    
-                    availability_data[pos_check].append(can_fit)
+        schedule_filtered = filter_schedule(st.session_state['schedule'], start_date, end_date)
 
-                    del players_info_dict[sim_player_name]
-
-            availability_df = pd.DataFrame(availability_data, index=valid_dates)
+        if schedule_filtered.empty:
+            st.info("Ei pelejä valitulla aikavälillä.")
+        else:
+            availability_df = calculate_position_availability(
+                schedule_filtered,
+                st.session_state['roster'],
+                pos_limits,
+                lineup_cache=lineup_cache,
+                schedule_index=schedule_index
+            )
             
             def color_cells(val):
                 color = 'green' if val else 'red'
                 return f'background-color: {color}'
 
             st.dataframe(
-                availability_df.style.applymap(color_cells),
+                availability_df.style.map(color_cells),
                 use_container_width=True
             )
 
@@ -809,11 +685,12 @@ with tab1:
         # Lisätään valintalaatikko vertailutyypille
         comparison_type = st.radio(
             "Valitse vertailutyyppi:",
-            ["Vertaa kahta uutta pelaajaa", "Vertaa uutta pelaajaa Lindgren rostersissa olevan pudottamista"],
+            ["Vertaa kahta uutta pelaajaa", "Vertaa uutta pelaajaa Lindgren rostersissa olevan pudottamista",
+             "Massavertailu: vapaat agentit × pudotettavat pelaajat"],
             key="comparison_type"
         )
         
-        elif comparison_type == "Vertaa kahta uutta pelaajaa":
+        if comparison_type == "Vertaa kahta uutta pelaajaa":
             # UI-kentät pelaajille A ja B
             st.markdown("#### Uusi pelaaja A")
             col1, col2, col3, col4 = st.columns(4)
@@ -838,70 +715,115 @@ with tab1:
                 sim_fpa_B = st.number_input("FP/GP", min_value=0.0, step=0.1, format="%.2f", key="sim_fpa_B")
         
             if st.button("Suorita vertailu"):
-                if not (sim_name_A and sim_team_A and sim_positions_A and sim_name_B and sim_team_B and sim_positions_B):
-                    st.warning("Täytä molempien uusien pelaajien kentät (nimi, joukkue, pelipaikat).")
-                    st.stop()
+                with profile_action("Vertailu"):
+                    if not (sim_name_A and sim_team_A and sim_positions_A and sim_name_B and sim_team_B and sim_positions_B):
+                        st.warning("Täytä molempien uusien pelaajien kentät (nimi, joukkue, pelipaikat).")
+                        st.stop()
         
-                original_roster_copy = st.session_state['roster'].copy()
-                if 'fantasy_points_avg' not in original_roster_copy.columns:
-                    original_roster_copy['fantasy_points_avg'] = 0.0
-                temp_roster = original_roster_copy.copy()
-                if remove_sim_player:
-                    temp_roster = temp_roster[temp_roster['name'] != remove_sim_player].copy()
+                    original_roster_copy = st.session_state['roster'].copy()
+                    if 'fantasy_points_avg' not in original_roster_copy.columns:
+                        original_roster_copy['fantasy_points_avg'] = 0.0
         
-                # Pelaaja A:n simulointi
-                new_player_A = {
-                    'name': sim_name_A,
-                    'team': sim_team_A,
-                    'positions': sim_positions_A,
-                    'fantasy_points_avg': sim_fpa_A
-                }
-                sim_roster_A = pd.concat([temp_roster, pd.DataFrame([new_player_A])], ignore_index=True)
+                    # Pelaaja A:n simulointi
+                    new_player_A = {
+                        'name': sim_name_A,
+                        'team': sim_team_A,
+                        'positions': sim_positions_A,
+                        'fantasy_points_avg': sim_fpa_A
+                    }
         
-                # Pelaaja B:n simulointi
-                new_player_B = {
-                    'name': sim_name_B,
-                    'team': sim_team_B,
-                    'positions': sim_positions_B,
-                    'fantasy_points_avg': sim_fpa_B
-                }
-                sim_roster_B = pd.concat([temp_roster, pd.DataFrame([new_player_B])], ignore_index=True)
+                    # Pelaaja B:n simulointi
+                    new_player_B = {
+                        'name': sim_name_B,
+                        'team': sim_team_B,
+                        'positions': sim_positions_B,
+                        'fantasy_points_avg': sim_fpa_B
+                    }
         
-                schedule_filtered = st.session_state['schedule'][
-                    (st.session_state['schedule']['Date'] >= pd.to_datetime(start_date)) &
-                    (st.session_state['schedule']['Date'] <= pd.to_datetime(end_date))
-                ]
+                    schedule_filtered = filter_schedule(st.session_state['schedule'], start_date, end_date)
         
-                with st.spinner("Lasketaan alkuperäistä kokonaispelimäärää ja pisteitä..."):
-                    _, original_total_games_dict, original_fp, _ = optimize_roster_advanced(schedule_filtered, st.session_state['roster'], pos_limits)
+                    variant_results = run_roster_variants(
+                        schedule_filtered,
+                        original_roster_copy,
+                        {'original': {}, 'A': {'add': [new_player_A]}, 'B': {'add': [new_player_B]}},
+                        {'original': "Alkuperäinen rosteri", 'A': sim_name_A, 'B': sim_name_B}
+                    )
+                    _, original_total_games_dict, original_fp, _ = variant_results['original']
                     original_total_games = sum(original_total_games_dict.values())
-        
-                with st.spinner(f"Lasketaan {sim_name_A}:n vaikutusta..."):
-                    _, total_games_A_dict, new_fp_A, _ = optimize_roster_advanced(schedule_filtered, sim_roster_A, pos_limits)
+                    _, total_games_A_dict, new_fp_A, _ = variant_results['A']
                     new_total_games_A = sum(total_games_A_dict.values())
-        
-                with st.spinner(f"Lasketaan {sim_name_B}:n vaikutusta..."):
-                    _, total_games_B_dict, new_fp_B, _ = optimize_roster_advanced(schedule_filtered, sim_roster_B, pos_limits)
+                    _, total_games_B_dict, new_fp_B, _ = variant_results['B']
                     new_total_games_B = sum(total_games_B_dict.values())
         
-                # Tulosten näyttö
-                st.subheader("Vertailun tulokset")
-                colA, colB = st.columns(2)
-                with colA:
-                    st.markdown(f"**{sim_name_A} ({sim_team_A})**")
-                    st.metric("Aktiiviset pelit", new_total_games_A)
-                    st.metric("Fantasiapisteet", f"{new_fp_A:.1f}")
-                with colB:
-                    st.markdown(f"**{sim_name_B} ({sim_team_B})**")
-                    st.metric("Aktiiviset pelit", new_total_games_B)
-                    st.metric("Fantasiapisteet", f"{new_fp_B:.1f}")
+                    # Tulosten näyttö
+                    st.subheader("Vertailun tulokset")
+                    colA, colB = st.columns(2)
+                    with colA:
+                        st.markdown(f"**{sim_name_A} ({sim_team_A})**")
+                        st.metric("Aktiiviset pelit", new_total_games_A)
+                        st.metric("Fantasiapisteet", f"{new_fp_A:.1f}")
+                    with colB:
+                        st.markdown(f"**{sim_name_B} ({sim_team_B})**")
+                        st.metric("Aktiiviset pelit", new_total_games_B)
+                        st.metric("Fantasiapisteet", f"{new_fp_B:.1f}")
         
-                st.subheader("Erot")
-                st.metric("Δ Aktiiviset pelit", f"{new_total_games_A - new_total_games_B:+}")
-                st.metric("Δ Fantasiapisteet", f"{new_fp_A - new_fp_B:+.1f}")
+                    st.subheader("Erot")
+                    st.metric("Δ Aktiiviset pelit", f"{new_total_games_A - new_total_games_B:+}")
+                    st.metric("Δ Fantasiapisteet", f"{new_fp_A - new_fp_B:+.1f}")
 
         
 
+        elif comparison_type == "Massavertailu: vapaat agentit × pudotettavat pelaajat":
+            st.markdown("Laskee kaikille lisättävä–pudotettava-pareille muutoksen rosterin kokonais-FP:hen ja aktiivisiin peleihin.")
+            free_agents_df = st.session_state.get('free_agents')
+            if free_agents_df is None or free_agents_df.empty:
+                st.info("Lataa vapaat agentit Google Sheetsistä käyttääksesi massavertailua.")
+            else:
+                # Oletuksena 50 parasta vapaata agenttia FP/GP:n mukaan
+                fa_by_fpa = free_agents_df.sort_values('fantasy_points_avg', ascending=False)
+                batch_candidates = st.multiselect(
+                    "Lisättävät vapaat agentit",
+                    fa_by_fpa['name'].tolist(),
+                    default=fa_by_fpa['name'].head(50).tolist(),
+                    key="batch_candidates"
+                )
+                batch_drops = st.multiselect(
+                    "Pudotettavat pelaajat",
+                    st.session_state['roster']['name'].tolist(),
+                    default=st.session_state['roster']['name'].tolist(),
+                    key="batch_drops"
+                )
+
+                if st.button("Suorita massavertailu", key="batch_compare_button"):
+                    with profile_action("Massavertailu"):
+                        if not batch_candidates or not batch_drops:
+                            st.warning("Valitse vähintään yksi lisättävä ja yksi pudotettava pelaaja.")
+                        else:
+                            schedule_filtered = filter_schedule(st.session_state['schedule'], start_date, end_date)
+                            candidates_df = fa_by_fpa[fa_by_fpa['name'].isin(batch_candidates)]
+                            with st.spinner(f"Lasketaan {len(candidates_df) * len(batch_drops)} vaihtoehtoa..."):
+                                fp_delta, games_delta = evaluate_add_drop_matrix(
+                                    schedule_filtered,
+                                    st.session_state['roster'],
+                                    candidates_df,
+                                    batch_drops,
+                                    pos_limits,
+                                    lineup_cache=lineup_cache,
+                                    schedule_index=schedule_index
+                                )
+
+                            best_candidate, best_drop = fp_delta.stack().idxmax()
+                            best_fp = fp_delta.loc[best_candidate, best_drop]
+                            if best_fp > 0:
+                                st.success(f"Paras vaihto: lisää **{best_candidate}**, pudota **{best_drop}** (FP {best_fp:+.2f}, pelit {games_delta.loc[best_candidate, best_drop]:+d}).")
+                            else:
+                                st.info("Mikään vaihto ei kasvattaisi rosterin kokonais-FP:tä.")
+
+                            st.subheader("Fantasiapisteiden muutos")
+                            st.dataframe(fp_delta.style.format("{:+.2f}"), use_container_width=True)
+                            st.subheader("Aktiivisten pelien muutos")
+                            st.dataframe(games_delta, use_container_width=True)
+
         else:  # Vertaa uutta pelaajaa Lindgren rostersissa olevan pudottamista
             st.markdown("#### Uusi pelaaja")
             colA1, colA2, colA3, colA4 = st.columns(4)
@@ -947,132 +869,59 @@ with tab1:
                 else:
                     drop_player_fpa = st.number_input("FP/GP", min_value=0.0, step=0.1, format="%.2f", value=0.0, key="drop_player_fpa_empty")
 
-        if st.button("Suorita vertailu"):
-            elif comparison_type == "Vertaa kahta uutta pelaajaa":
-                if not (sim_name_A and sim_team_A and sim_positions_A and sim_name_B and sim_team_B and sim_positions_B):
-                    st.warning("Täytä molempien uusien pelaajien kentät (nimi, joukkue, pelipaikat).")
-                    st.stop()
-            
-                original_roster_copy = st.session_state['roster'].copy()
-                if 'fantasy_points_avg' not in original_roster_copy.columns:
-                    original_roster_copy['fantasy_points_avg'] = 0.0
-                temp_roster = original_roster_copy.copy()
-                if remove_sim_player:
-                    temp_roster = temp_roster[temp_roster['name'] != remove_sim_player].copy()
-            
-                # Pelaaja A:n simulointi
-                new_player_A = {
-                    'name': sim_name_A,
-                    'team': sim_team_A,
-                    'positions': sim_positions_A,
-                    'fantasy_points_avg': sim_fpa_A
-                }
-                sim_roster_A = pd.concat([temp_roster, pd.DataFrame([new_player_A])], ignore_index=True)
-            
-                # Pelaaja B:n simulointi
-                new_player_B = {
-                    'name': sim_name_B,
-                    'team': sim_team_B,
-                    'positions': sim_positions_B,
-                    'fantasy_points_avg': sim_fpa_B
-                }
-                sim_roster_B = pd.concat([temp_roster, pd.DataFrame([new_player_B])], ignore_index=True)
-            
-                schedule_filtered = st.session_state['schedule'][
-                    (st.session_state['schedule']['Date'] >= pd.to_datetime(start_date)) &
-                    (st.session_state['schedule']['Date'] <= pd.to_datetime(end_date))
-                ]
-            
-                with st.spinner("Lasketaan alkuperäistä kokonaispelimäärää ja pisteitä..."):
-                    _, original_total_games_dict, original_fp, _ = optimize_roster_advanced(schedule_filtered, st.session_state['roster'], pos_limits)
-                    original_total_games = sum(original_total_games_dict.values())
-            
-                with st.spinner(f"Lasketaan {sim_name_A}:n vaikutusta..."):
-                    _, total_games_A_dict, new_fp_A, _ = optimize_roster_advanced(schedule_filtered, sim_roster_A, pos_limits)
-                    new_total_games_A = sum(total_games_A_dict.values())
-            
-                with st.spinner(f"Lasketaan {sim_name_B}:n vaikutusta..."):
-                    _, total_games_B_dict, new_fp_B, _ = optimize_roster_advanced(schedule_filtered, sim_roster_B, pos_limits)
-                    new_total_games_B = sum(total_games_B_dict.values())
-            
-                # Tulosten näyttö
-                st.subheader("Vertailun tulokset")
-                colA, colB = st.columns(2)
-                with colA:
-                    st.markdown(f"**{sim_name_A} ({sim_team_A})**")
-                    st.metric("Aktiiviset pelit", new_total_games_A)
-                    st.metric("Fantasiapisteet", f"{new_fp_A:.1f}")
-                with colB:
-                    st.markdown(f"**{sim_name_B} ({sim_team_B})**")
-                    st.metric("Aktiiviset pelit", new_total_games_B)
-                    st.metric("Fantasiapisteet", f"{new_fp_B:.1f}")
-            
-            
-            else:  # Vertaa uutta pelaajaa Lindgren rostersissa olevan pudottamista
-                if new_player_name and new_player_team and new_player_positions and drop_player_name:
+            if st.button("Suorita vertailu", key="drop_compare_button"):
+                with profile_action("Pudotusvertailu"):
+                    if new_player_name and new_player_team and new_player_positions and drop_player_name:
                     
-                    # Luo uusi pelaaja
-                    new_player = {'name': new_player_name, 'team': new_player_team, 'positions': new_player_positions, 'fantasy_points_avg': new_player_fpa}
+                        # Luo uusi pelaaja
+                        new_player = {'name': new_player_name, 'team': new_player_team, 'positions': new_player_positions, 'fantasy_points_avg': new_player_fpa}
                     
-                    # Luo pudotettava pelaaja
-                    drop_player = {'name': drop_player_name, 'team': drop_player_team, 'positions': drop_player_positions, 'fantasy_points_avg': drop_player_fpa}
+                        # Luo pudotettava pelaaja
+                        drop_player = {'name': drop_player_name, 'team': drop_player_team, 'positions': drop_player_positions, 'fantasy_points_avg': drop_player_fpa}
                     
-                    schedule_filtered = st.session_state['schedule'][
-                        (st.session_state['schedule']['Date'] >= pd.to_datetime(start_date)) &
-                        (st.session_state['schedule']['Date'] <= pd.to_datetime(end_date))
-                    ]
+                        schedule_filtered = filter_schedule(st.session_state['schedule'], start_date, end_date)
                     
-                    # Lasketaan alkuperäinen rosteri
-                    with st.spinner("Lasketaan alkuperäistä kokonaispelimäärää ja pisteitä..."):
-                        _, original_total_games_dict, original_fp, _ = optimize_roster_advanced(
+                        # Lasketaan alkuperäinen ja muokattu rosteri: pudotettava pelaaja pois, uusi pelaaja tilalle
+                        variant_results = run_roster_variants(
                             schedule_filtered,
                             st.session_state['roster'],
-                            pos_limits
+                            {'original': {}, 'modified': {'drop': [drop_player_name], 'add': [new_player]}},
+                            {'original': "Alkuperäinen rosteri", 'modified': "Muokattu rosteri"}
                         )
+                        _, original_total_games_dict, original_fp, _ = variant_results['original']
                         original_total_games = sum(original_total_games_dict.values())
-                    
-                    # Luodaan muokattu rosteri: poistetaan pudotettava pelaaja ja lisätään uusi pelaaja
-                    modified_roster = st.session_state['roster'][st.session_state['roster']['name'] != drop_player_name].copy()
-                    modified_roster = pd.concat([modified_roster, pd.DataFrame([new_player])], ignore_index=True)
-                    
-                    # Lasketaan muokatun rosterin tulokset
-                    with st.spinner(f"Lasketaan muutoksen vaikutusta..."):
-                        _, modified_total_games_dict, modified_fp, _ = optimize_roster_advanced(
-                            schedule_filtered,
-                            modified_roster,
-                            pos_limits
-                        )
+                        _, modified_total_games_dict, modified_fp, _ = variant_results['modified']
                         modified_total_games = sum(modified_total_games_dict.values())
                         new_player_impact_days = modified_total_games_dict.get(new_player_name, 0)
                     
-                    st.subheader("Vertailun tulokset")
+                        st.subheader("Vertailun tulokset")
                     
-                    col_vertailu_1, col_vertailu_2 = st.columns(2)
+                        col_vertailu_1, col_vertailu_2 = st.columns(2)
                     
-                    with col_vertailu_1:
-                        st.markdown(f"**Uusi pelaaja: {new_player_name}**")
-                        st.metric("Pelien muutos", f"{modified_total_games - original_total_games}", help="Muutoksen vaikutus kokonaispelimäärään")
-                        st.metric("Omat pelit", new_player_impact_days)
-                        st.metric("Fantasiapiste-ero", f"{modified_fp - original_fp:.2f}", help="Muutoksen vaikutus fantasiapisteisiin")
+                        with col_vertailu_1:
+                            st.markdown(f"**Uusi pelaaja: {new_player_name}**")
+                            st.metric("Pelien muutos", f"{modified_total_games - original_total_games}", help="Muutoksen vaikutus kokonaispelimäärään")
+                            st.metric("Omat pelit", new_player_impact_days)
+                            st.metric("Fantasiapiste-ero", f"{modified_fp - original_fp:.2f}", help="Muutoksen vaikutus fantasiapisteisiin")
                         
-                    with col_vertailu_2:
-                        st.markdown(f"**Pudotettava pelaaja: {drop_player_name}**")
-                        st.metric("Menetetyt pelit", f"{original_total_games_dict.get(drop_player_name, 0)}", help="Pudotettavan pelaajan pelien määrä")
-                        st.metric("Menetetyt FP", f"{original_total_games_dict.get(drop_player_name, 0) * drop_player_fpa:.2f}", help="Pudotettavan pelaajan menettämät pisteet")
+                        with col_vertailu_2:
+                            st.markdown(f"**Pudotettava pelaaja: {drop_player_name}**")
+                            st.metric("Menetetyt pelit", f"{original_total_games_dict.get(drop_player_name, 0)}", help="Pudotettavan pelaajan pelien määrä")
+                            st.metric("Menetetyt FP", f"{original_total_games_dict.get(drop_player_name, 0) * drop_player_fpa:.2f}", help="Pudotettavan pelaajan menettämät pisteet")
                         
-                    st.markdown("---")
+                        st.markdown("---")
                     
-                    st.subheader("Yhteenveto")
+                        st.subheader("Yhteenveto")
                     
-                    if modified_fp > original_fp:
-                        st.success(f"Muutos on kannattava! Rosterisi kokonais-FP olisi arviolta **{modified_fp - original_fp:.2f}** pistettä suurempi.")
-                    elif modified_fp < original_fp:
-                        st.error(f"Muutos ei ole kannattava. Rosterisi kokonais-FP olisi arviolta **{original_fp - modified_fp:.2f}** pistettä pienempi.")
-                    else:
-                        st.info("Fantasiapisteissä ei ole eroa.")
+                        if modified_fp > original_fp:
+                            st.success(f"Muutos on kannattava! Rosterisi kokonais-FP olisi arviolta **{modified_fp - original_fp:.2f}** pistettä suurempi.")
+                        elif modified_fp < original_fp:
+                            st.error(f"Muutos ei ole kannattava. Rosterisi kokonais-FP olisi arviolta **{original_fp - modified_fp:.2f}** pistettä pienempi.")
+                        else:
+                            st.info("Fantasiapisteissä ei ole eroa.")
 
-                else:
-                    st.warning("Syötä uuden pelaajan tiedot ja valitse pudotettava pelaaja suorittaaksesi vertailun.")
+                    else:
+                        st.warning("Syötä uuden pelaajan tiedot ja valitse pudotettava pelaaja suorittaaksesi vertailun.")
     else:
         st.info("Lataa rosteri ja peliaikataulu, jotta voit vertailla pelaajia.")
 
@@ -1089,18 +938,18 @@ with tab1:
     if st.session_state['schedule'].empty or st.session_state['roster'].empty:
         st.warning("Lataa sekä peliaikataulu että rosteri aloittaaksesi analyysin.")
     else:
-        schedule_filtered = st.session_state['schedule'][
-            (st.session_state['schedule']['Date'] >= pd.to_datetime(start_date)) &
-            (st.session_state['schedule']['Date'] <= pd.to_datetime(end_date))
-        ]
+        schedule_filtered = filter_schedule(st.session_state['schedule'], start_date, end_date)
 
         if not schedule_filtered.empty:
             if st.button("Suorita joukkueanalyysi"):
-                st.session_state['team_impact_results'] = calculate_team_impact_by_position(
-                    schedule_filtered,
-                    st.session_state['roster'],
-                    pos_limits
-                )
+                with profile_action("Joukkueanalyysi"):
+                    st.session_state['team_impact_results'] = calculate_team_impact_by_position(
+                        schedule_filtered,
+                        st.session_state['roster'],
+                        pos_limits,
+                        lineup_cache=lineup_cache,
+                        schedule_index=schedule_index
+                    )
             
             if st.session_state['team_impact_results'] is not None:
                 for pos, df in st.session_state['team_impact_results'].items():
@@ -1108,10 +957,16 @@ with tab1:
                     st.dataframe(df, use_container_width=True)
 
 # --- Vapaiden agenttien analyysi ---
-if st.session_state.get('free_agents') is not None and not st.session_state['free_agents'].empty and \
-   st.session_state.get('team_impact_results') is not None and st.session_state['team_impact_results']:
+if st.session_state.get('free_agents') is not None and not st.session_state['free_agents'].empty:
     st.header("Vapaiden agenttien analyysi")
     
+    analysis_mode = st.radio(
+        "Analyysitapa:",
+        ["Joukkueanalyysin lisäpelit", "Todellinen FP-vaikutus rosteriin"],
+        key="free_agent_analysis_mode",
+        help="Todellinen FP-vaikutus optimoi kokoonpanot pelaaja lisättynä, jolloin vahva pelaaja voi siirtää heikompia penkille."
+    )
+    
     # Suodatusvalikot
     all_positions = sorted(list(set(p.strip() for player_pos in st.session_state['free_agents']['positions'].unique() for p in player_pos.replace('/', ',').split(','))))
     # TÄSSÄ MUUTOS: selectboxista multiselectiin
@@ -1121,31 +976,55 @@ if st.session_state.get('free_agents') is not None and not st.session_state['fre
     selected_team = st.selectbox("Suodata joukkueen mukaan:", ["Kaikki"] + list(all_teams))
 
     if st.button("Suorita vapaiden agenttien analyysi", key="free_agent_analysis_button_new"):
-        with st.spinner("Analysoidaan vapaat agentit..."):
-            free_agent_results = analyze_free_agents(
-                st.session_state['team_impact_results'],
-                st.session_state['free_agents']
-            )
+        with profile_action("Vapaiden agenttien analyysi"):
+            free_agent_results = pd.DataFrame()
+            if analysis_mode == "Joukkueanalyysin lisäpelit":
+                if not st.session_state.get('team_impact_results'):
+                    st.warning("Suorita ensin joukkueanalyysi.")
+                else:
+                    try:
+                        with st.spinner("Analysoidaan vapaat agentit..."):
+                            free_agent_results = analyze_free_agents(
+                                st.session_state['team_impact_results'],
+                                st.session_state['free_agents']
+                            )
+                        if free_agent_results.empty:
+                            st.info("Vapaita agentteja ei löytynyt maalivahtien suodatuksen jälkeen.")
+                    except ValueError as e:
+                        st.warning(str(e))
+            elif st.session_state['schedule'].empty or st.session_state['roster'].empty or start_date > end_date:
+                st.warning("Lataa peliaikataulu ja rosteri sekä tarkista aikaväli.")
+            else:
+                schedule_filtered = filter_schedule(st.session_state['schedule'], start_date, end_date)
+                with st.spinner("Lasketaan vapaiden agenttien todellinen vaikutus..."):
+                    free_agent_results = rank_free_agents_by_marginal_value(
+                        schedule_filtered,
+                        st.session_state['roster'],
+                        st.session_state['free_agents'],
+                        pos_limits,
+                        lineup_cache=lineup_cache,
+                        schedule_index=schedule_index
+                    )
         
-        filtered_results = free_agent_results.copy()
+            filtered_results = free_agent_results.copy()
         
-        # PÄIVITETTY SUODATUSLOGIIKKA
-        if selected_pos: # Tarkistaa, että lista ei ole tyhjä
-            # Suodata tulokset pelaajan pelipaikkojen ja valitun listan perusteella
-            filtered_results = filtered_results[filtered_results['positions'].apply(
-                lambda x: any(pos in x.split('/') for pos in selected_pos)
-            )]
+            # PÄIVITETTY SUODATUSLOGIIKKA
+            if selected_pos and not filtered_results.empty: # Tarkistaa, että lista ei ole tyhjä
+                # Suodata tulokset pelaajan pelipaikkojen ja valitun listan perusteella
+                filtered_results = filtered_results[filtered_results['positions'].apply(
+                    lambda x: any(pos in parse_positions(x) for pos in selected_pos)
+                )]
         
-        if selected_team != "Kaikki":
-            filtered_results = filtered_results[filtered_results['team'] == selected_team]
+            if selected_team != "Kaikki" and not filtered_results.empty:
+                filtered_results = filtered_results[filtered_results['team'] == selected_team]
             
-        if not filtered_results.empty:
-            st.dataframe(filtered_results.style.format({
-                'total_impact': "{:.2f}",
-                'fantasy_points_avg': "{:.1f}"
-            }), use_container_width=True)
-        else:
-            st.error("Analyysituloksia ei löytynyt valituilla suodattimilla.")
+            if not filtered_results.empty:
+                st.dataframe(filtered_results.style.format({
+                    'total_impact': "{:.2f}",
+                    'fantasy_points_avg': "{:.1f}"
+                }), use_container_width=True)
+            else:
+                st.error("Analyysituloksia ei löytynyt valituilla suodattimilla.")
 
 with tab2:
     st.header("🆚 Joukkuevertailu")
@@ -1156,86 +1035,227 @@ with tab2:
     elif st.session_state['schedule'].empty:
         st.warning("Lataa peliaikataulu vertailua varten.")
     else:
-        schedule_filtered = st.session_state['schedule'][
-            (st.session_state['schedule']['Date'] >= pd.to_datetime(start_date)) &
-            (st.session_state['schedule']['Date'] <= pd.to_datetime(end_date))
-        ]
+        schedule_filtered = filter_schedule(st.session_state['schedule'], start_date, end_date)
 
         if schedule_filtered.empty:
             st.warning("Ei pelejä valitulla aikavälillä.")
         else:
+            matchup_simulations = st.number_input(
+                "Simuloitujen otteluiden määrä",
+                min_value=1000,
+                max_value=100000,
+                value=100000,
+                step=10000,
+                key="matchup_simulations",
+                help="Jokainen aktiivinen peli arvotaan pelaajan FP/GP:n ympäriltä. Valinnaiset sarakkeet 'fantasy_points_std' tai 'fantasy_points_var' antavat pelaajakohtaisen hajonnan."
+            )
             if st.button("Suorita joukkuevertailu", key="roster_compare_button"):
-                with st.spinner("Vertailu käynnissä..."):
-                    
-                    # Lasketaan oma rosteri
-                    _, my_games_dict, my_fp, my_total_games = optimize_roster_advanced(
-                        schedule_filtered, st.session_state['roster'], pos_limits
-                    )
+                with profile_action("Joukkuevertailu"):
+                    with st.spinner("Vertailu käynnissä..."):
                     
-                    # Lasketaan vastustajan rosteri
-                    _, opponent_games_dict, opponent_fp, opponent_total_games = optimize_roster_advanced(
-                        schedule_filtered, st.session_state['opponent_roster'], pos_limits
-                    )
+                        # Lasketaan oma ja vastustajan rosteri
+                        variant_results = run_roster_variants(
+                            schedule_filtered,
+                            st.session_state['roster'],
+                            {'my': {}, 'opponent': {'roster': st.session_state['opponent_roster']}},
+                            {'my': "Oma joukkue", 'opponent': "Vastustaja"}
+                        )
+                        my_daily, my_games_dict, my_fp, my_total_games = variant_results['my']
+                        opponent_daily, opponent_games_dict, opponent_fp, opponent_total_games = variant_results['opponent']
 
-                    # Kootaan omien pelaajien tiedot DataFrameen
-                    my_players_data = []
-                    for name, games in my_games_dict.items():
-                        fpa = st.session_state['roster'][st.session_state['roster']['name'] == name]['fantasy_points_avg'].iloc[0] if not st.session_state['roster'][st.session_state['roster']['name'] == name].empty else 0
-                        total_fp_player = games * fpa
-                        my_players_data.append({
-                            'Pelaaja': name,
-                            'Aktiiviset pelit': games,
-                            'Ennakoidut FP': round(total_fp_player, 2)
-                        })
-                    my_df = pd.DataFrame(my_players_data).sort_values(by='Ennakoidut FP', ascending=False)
-
-                    # Kootaan vastustajan pelaajien tiedot DataFrameen
-                    opponent_players_data = []
-                    for name, games in opponent_games_dict.items():
-                        fpa = st.session_state['opponent_roster'][st.session_state['opponent_roster']['name'] == name]['fantasy_points_avg'].iloc[0] if not st.session_state['opponent_roster'][st.session_state['opponent_roster']['name'] == name].empty else 0
-                        total_fp_player = games * fpa
-                        opponent_players_data.append({
-                            'Pelaaja': name,
-                            'Aktiiviset pelit': games,
-                            'Ennakoidut FP': round(total_fp_player, 2)
-                        })
-                    opponent_df = pd.DataFrame(opponent_players_data).sort_values(by='Ennakoidut FP', ascending=False)
+                        # Pelaajakohtaiset taulukot lasketaan pitkämuotoisista kokoonpanoista
+                        my_df = player_totals_table(my_daily, st.session_state['roster'], my_games_dict)
+                        opponent_df = player_totals_table(opponent_daily, st.session_state['opponent_roster'], opponent_games_dict)
                     
-                    st.subheader("Yksityiskohtainen vertailu")
-                    col1_detail, col2_detail = st.columns(2)
-                    with col1_detail:
-                        st.markdown("**Oma joukkueesi**")
-                        st.dataframe(my_df, use_container_width=True)
-                    with col2_detail:
-                        st.markdown("**Vastustajan joukkue**")
-                        st.dataframe(opponent_df, use_container_width=True)
+                        st.subheader("Yksityiskohtainen vertailu")
+                        col1_detail, col2_detail = st.columns(2)
+                        with col1_detail:
+                            st.markdown("**Oma joukkueesi**")
+                            st.dataframe(my_df, use_container_width=True)
+                        with col2_detail:
+                            st.markdown("**Vastustajan joukkue**")
+                            st.dataframe(opponent_df, use_container_width=True)
                         
-                    st.subheader("Yhteenveto")
-                    vertailu_col1, vertailu_col2 = st.columns(2)
-                    with vertailu_col1:
-                        st.metric("Oman joukkueen aktiiviset pelit", my_total_games)
-                    with vertailu_col2:
-                        st.metric("Vastustajan aktiiviset pelit", opponent_total_games)
-
-                    st.markdown("---")
+                        st.subheader("Yhteenveto")
+                        vertailu_col1, vertailu_col2 = st.columns(2)
+                        with vertailu_col1:
+                            st.metric("Oman joukkueen aktiiviset pelit", my_total_games)
+                        with vertailu_col2:
+                            st.metric("Vastustajan aktiiviset pelit", opponent_total_games)
+
+                        st.markdown("---")
                     
-                    vertailu_fp_col1, vertailu_fp_col2 = st.columns(2)
-                    with vertailu_fp_col1:
-                        st.metric("Oman joukkueen FP", f"{my_fp:.2f}")
-                    with vertailu_fp_col2:
-                        st.metric("Vastustajan FP", f"{opponent_fp:.2f}")
+                        vertailu_fp_col1, vertailu_fp_col2 = st.columns(2)
+                        with vertailu_fp_col1:
+                            st.metric("Oman joukkueen FP", f"{my_fp:.2f}")
+                        with vertailu_fp_col2:
+                            st.metric("Vastustajan FP", f"{opponent_fp:.2f}")
+
+                        matchup = simulate_matchup(
+                            st.session_state['roster'], my_games_dict,
+                            st.session_state['opponent_roster'], opponent_games_dict,
+                            num_simulations=int(matchup_simulations)
+                        )
+                        st.subheader("Voittotodennäköisyys")
+                        probability_col1, probability_col2, probability_col3 = st.columns(3)
+                        with probability_col1:
+                            st.metric("Oma voitto", f"{matchup['win_probability']:.1%}")
+                        with probability_col2:
+                            st.metric("Vastustajan voitto", f"{matchup['loss_probability']:.1%}")
+                        with probability_col3:
+                            st.metric("Pisteeron keskihajonta", f"{matchup['margin_std']:.1f}")
+                        percentiles = matchup['margin_percentiles']
+                        st.caption(
+                            f"Pisteero (oma − vastustaja): mediaani {percentiles[50]:+.1f}, "
+                            f"50 %:n väli {percentiles[25]:+.1f} … {percentiles[75]:+.1f}, "
+                            f"90 %:n väli {percentiles[5]:+.1f} … {percentiles[95]:+.1f}"
+                        )
+                        margin_counts, margin_edges = np.histogram(matchup['margins'], bins=40)
+                        st.bar_chart(pd.DataFrame(
+                            {'Simulaatioita': margin_counts},
+                            index=pd.Index(np.round((margin_edges[:-1] + margin_edges[1:]) / 2, 1), name='Pisteero')
+                        ))
+
+
+                        if my_total_games > opponent_total_games:
+                            st.success(f"Oma joukkueesi saa arviolta **{my_total_games - opponent_total_games}** enemmän aktiivisia pelejä kuin vastustaja.")
+                        elif my_total_games < opponent_total_games:
+                            st.error(f"Vastustajan joukkue saa arviolta **{opponent_total_games - my_total_games}** enemmän aktiivisia pelejä kuin sinun joukkueesi.")
+                        else:
+                            st.info("Ennakoiduissa aktiivisissa peleissä ei ole eroa.")
+
+                        if my_fp > opponent_fp:
+                            st.success(f"Oma joukkueesi saa arviolta **{my_fp - opponent_fp:.2f}** enemmän fantasiapisteitä kuin vastustaja. Hyvin todennäköisesti voitat tämän viikon!")
+                        elif my_fp < opponent_fp:
+                            st.error(f"Vastustajasi saa arviolta **{opponent_fp - my_fp:.2f}** enemmän fantasiapisteitä kuin sinun joukkueesi. Sinun kannattaa harkita rosterisi muutoksia.")
+                        else:
+                            st.info("Ennakoiduissa fantasiapisteissä ei ole eroa.")
 
+    st.markdown("---")
+    st.header("🏆 Liigan projektio")
+    st.markdown("Projisoi kaikkien liigan joukkueiden aktiiviset pelit ja fantasiapisteet päivittäin valitulla aikavälillä.")
+    league_files = st.file_uploader(
+        "Liigan rosterit (CSV)",
+        type=["csv"],
+        accept_multiple_files=True,
+        key="league_roster_uploader",
+        help=f"Yksi CSV-tiedosto per joukkue (joukkueen nimenä tiedoston nimi) tai yksi tiedosto, jossa sarake '{LEAGUE_TEAM_COLUMN}' kertoo joukkueen."
+    )
+    if st.session_state['schedule'].empty:
+        st.warning("Lataa peliaikataulu liigan projektiota varten.")
+    elif league_files and st.button("Projisoi liiga", key="league_projection_button"):
+        with profile_action("Liigan projektio"):
+            try:
+                league_rosters = {}
+                for league_file in league_files:
+                    add_league_rosters(
+                        league_rosters,
+                        load_league_roster_file(league_file, os.path.splitext(league_file.name)[0]),
+                        league_file.name
+                    )
+                schedule_filtered = filter_schedule(st.session_state['schedule'], start_date, end_date)
+                if schedule_filtered.empty:
+                    st.warning("Ei pelejä valitulla aikavälillä.")
+                else:
+                    with st.spinner(f"Projisoidaan {len(league_rosters)} joukkuetta..."):
+                        league_games, league_fp = project_league(
+                            schedule_filtered, league_rosters, pos_limits,
+                            max_workers=parallel_workers, method=optimizer_method,
+                            lineup_cache=lineup_cache, schedule_index=schedule_index
+                        )
+                    league_summary = pd.DataFrame({
+                        'Aktiiviset pelit': league_games.sum(axis=1),
+                        'Ennakoidut FP': league_fp.sum(axis=1).round(2)
+                    }).sort_values('Ennakoidut FP', ascending=False)
+                    st.subheader("Yhteenveto")
+                    st.dataframe(league_summary, use_container_width=True)
+                    for title, matrix in [("Aktiiviset pelit päivittäin", league_games),
+                                          ("Fantasiapisteet päivittäin", league_fp.round(2))]:
+                        st.subheader(title)
+                        matrix = matrix.copy()
+                        matrix.columns = [date.strftime('%Y-%m-%d') for date in matrix.columns]
+                        st.dataframe(matrix, use_container_width=True)
+            except ValueError as e:
+                st.error(str(e))
+
+# --- SIVUPALKKI: VÄLIMUISTIN TILASTOT ---
+lineup_cache_stats = lineup_cache.stats()
+st.sidebar.caption(
+    f"Kokoonpanovälimuisti: {lineup_cache_stats['hits']} osumaa "
+    f"({lineup_cache_stats['disk_hits']} levyltä), {lineup_cache_stats['misses']} ohitusta, "
+    f"{lineup_cache_stats['size']} tallennettua päivää"
+)
+optimization_cache_stats = optimization_result_cache.stats()
+st.sidebar.caption(
+    f"Optimointitulosten välimuisti: {optimization_cache_stats['hits']} osumaa, "
+    f"{optimization_cache_stats['misses']} ohitusta, {optimization_cache_stats['size']} tallennettua tulosta"
+)
 
-                    if my_total_games > opponent_total_games:
-                        st.success(f"Oma joukkueesi saa arviolta **{my_total_games - opponent_total_games}** enemmän aktiivisia pelejä kuin vastustaja.")
-                    elif my_total_games < opponent_total_games:
-                        st.error(f"Vastustajan joukkue saa arviolta **{opponent_total_games - my_total_games}** enemmän aktiivisia pelejä kuin sinun joukkueesi.")
-                    else:
-                        st.info("Ennakoiduissa aktiivisissa peleissä ei ole eroa.")
+# --- SIVUPALKKI: SUORITUSKYKYMITTARIT ---
+if st.session_state.get('debug_metrics', False):
+    with st.sidebar.expander("⏱️ Suorituskykymittarit", expanded=True):
+        metrics_snapshot = metrics.snapshot()
+        if metrics_snapshot['spans']:
+            spans_df = pd.DataFrame([
+                {
+                    'Vaihe': phase,
+                    'Kutsut': span['count'],
+                    'Yhteensä (s)': round(span['total_s'], 4),
+                    'Pisin (s)': round(span['max_s'], 4)
+                }
+                for phase, span in metrics_snapshot['spans'].items()
+            ]).sort_values('Yhteensä (s)', ascending=False)
+            st.dataframe(spans_df, use_container_width=True, hide_index=True)
+        else:
+            st.caption("Ei vielä mitattuja vaiheita.")
+        if metrics_snapshot['counters']:
+            st.dataframe(
+                pd.DataFrame({
+                    'Laskuri': list(metrics_snapshot['counters'].keys()),
+                    'Arvo': list(metrics_snapshot['counters'].values())
+                }),
+                use_container_width=True,
+                hide_index=True
+            )
+        st.download_button(
+            "Lataa JSON",
+            data=metrics.to_json().encode('utf-8'),
+            file_name='mittarit.json',
+            mime='application/json',
+            key="metrics_json_download"
+        )
+        st.download_button(
+            "Lataa Prometheus-muodossa",
+            data=metrics.to_prometheus().encode('utf-8'),
+            file_name='mittarit.prom',
+            mime='text/plain',
+            key="metrics_prometheus_download"
+        )
+        if st.button("Nollaa mittarit", key="metrics_reset_button"):
+            metrics.reset()
+            st.rerun()
 
-                    if my_fp > opponent_fp:
-                        st.success(f"Oma joukkueesi saa arviolta **{my_fp - opponent_fp:.2f}** enemmän fantasiapisteitä kuin vastustaja. Hyvin todennäköisesti voitat tämän viikon!")
-                    elif my_fp < opponent_fp:
-                        st.error(f"Vastustajasi saa arviolta **{opponent_fp - my_fp:.2f}** enemmän fantasiapisteitä kuin sinun joukkueesi. Sinun kannattaa harkita rosterisi muutoksia.")
-                    else:
-                        st.info("Ennakoiduissa fantasiapisteissä ei ole eroa.")
+# --- SIVUPALKKI: PROFIILI ---
+last_profile = st.session_state.get('last_profile')
+if last_profile is not None:
+    with st.sidebar.expander(f"🔬 Profiili: {last_profile['label']} ({last_profile['elapsed']:.2f} s)"):
+        st.dataframe(
+            pd.DataFrame(last_profile['top']).rename(columns={
+                'function': 'Funktio',
+                'calls': 'Kutsut',
+                'own_s': 'Oma aika (s)',
+                'cumulative_s': 'Kumulatiivinen (s)'
+            }).round(4),
+            use_container_width=True,
+            hide_index=True
+        )
+        st.download_button(
+            "Lataa .prof-tiedosto",
+            data=last_profile['data'],
+            file_name='profiili.prof',
+            mime='application/octet-stream',
+            key="profile_download"
+        )
+        if st.button("Poista profiili", key="profile_clear_button"):
+            del st.session_state['last_profile']
+            st.rerun()
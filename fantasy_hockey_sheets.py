@@ -0,0 +1,287 @@
+"""
+Google Sheets -latausten välimuisti.
+
+SheetCache tallentaa jokaisen taulukon jäsennetyn DataFramen taulukon URL:n
+perusteella. TTL:n sisällä palautetaan välimuistissa oleva kopio ilman
+verkkokutsuja. TTL:n umpeuduttua kysytään ensin taulukon revisio (Drive API:n
+modifiedTime), ja tiedot ladataan uudelleen vain, jos revisio on muuttunut.
+Käyttäjän pyytämät lataukset (revalidate=True) tarkistavat revision aina, jotta
+juuri muokattu taulukko ei jää TTL:n ajaksi vanhaksi.
+
+Varsinainen haku tehdään erillisen hakurajapinnan kautta: GspreadSheetFetcher
+käyttää gspreadia ja LocalSheetFetcher pitää taulukot muistissa. Jälkimmäinen
+mahdollistaa välimuistin kokeilun ilman verkkoyhteyttä. Suurista taulukoista
+haetaan fetch_columns-metodilla vain tarvittavat sarakkeet yhdellä
+eräkutsulla, ja ne muunnetaan suoraan tyypitetyksi DataFrameksi.
+
+load_sources lataa useita lähteitä (taulukoita ja tiedostoja) yhtä aikaa
+säiepoolissa, jolloin kokonaisaika on hitaimman lähteen aika.
+"""
+import contextvars
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+import pandas as pd
+from gspread.utils import Dimension, ValueRenderOption, extract_id_from_url, rowcol_to_a1
+
+from fantasy_hockey_metrics import metrics
+
+ROSTER_COLUMNS = ['name', 'team', 'positions', 'fantasy_points_avg']
+
+# Oletusaika sekunteina, jonka välimuistin kopio kelpaa ilman revision tarkistusta
+DEFAULT_SHEET_TTL = 300
+
+# Oletusaikakatkaisu sekunteina yhden lähteen lataukselle
+DEFAULT_SOURCE_TIMEOUT = 30
+
+# --- HAKURAJAPINNAT ---
+class GspreadSheetFetcher:
+    """
+    Hakee taulukot Google Sheetsistä gspread-asiakkaalla.
+
+    get_revision palauttaa taulukon viimeisimmän muokkausajan Drive API:sta. Jos
+    sitä ei voi lukea (esim. asiakkaalla ei ole Drive-oikeutta), palautetaan None,
+    jolloin välimuisti lataa tiedot uudelleen aina TTL:n umpeuduttua.
+    """
+    def __init__(self, client):
+        self.client = client
+
+    def get_revision(self, url):
+        try:
+            metadata = self.client.get_file_drive_metadata(extract_id_from_url(url))
+            return metadata.get('modifiedTime')
+        except Exception:
+            return None
+
+    def fetch_records(self, url):
+        return self.client.open_by_url(url).sheet1.get_all_records()
+
+    def fetch_columns(self, url, columns):
+        """
+        Hakee otsikkorivin ja sen jälkeen vain pyydetyt sarakkeet yhdellä
+        values.batchGet-kutsulla muotoilemattomina arvoina. Palauttaa
+        {sarake: arvolista}; puuttuvat sarakkeet jätetään pois ja lyhyemmät
+        sarakkeet täydennetään tyhjillä arvoilla yhtä pitkiksi.
+        """
+        worksheet = self.client.open_by_url(url).sheet1
+        header = worksheet.row_values(1)
+        column_numbers = {}
+        for number, name in enumerate(header, start=1):
+            column_numbers.setdefault(name, number)
+        present = [column for column in columns if column in column_numbers]
+        ranges = []
+        for column in present:
+            letter = re.sub(r'\d', '', rowcol_to_a1(1, column_numbers[column]))
+            ranges.append(f"{letter}2:{letter}")
+        value_ranges = worksheet.batch_get(
+            ranges, major_dimension=Dimension.cols, value_render_option=ValueRenderOption.unformatted
+        ) if ranges else []
+        return pad_columns({
+            column: list(value_range[0]) if value_range else []
+            for column, value_range in zip(present, value_ranges)
+        })
+
+class LocalSheetFetcher:
+    """
+    Muistissa toimiva hakurajapinta, joka käyttäytyy kuten Google Sheets.
+    Jokainen set_records-kutsu kasvattaa taulukon revisiota. fetch_count kertoo,
+    kuinka monta kertaa tiedot on todella ladattu.
+    """
+    def __init__(self, sheets=None):
+        self.sheets = {}
+        self.fetch_count = 0
+        for url, records in (sheets or {}).items():
+            self.set_records(url, records)
+
+    def set_records(self, url, records):
+        revision = self.sheets[url][1] + 1 if url in self.sheets else 1
+        self.sheets[url] = (list(records), revision)
+
+    def get_revision(self, url):
+        return self.sheets[url][1]
+
+    def fetch_records(self, url):
+        self.fetch_count += 1
+        return list(self.sheets[url][0])
+
+    def fetch_columns(self, url, columns):
+        self.fetch_count += 1
+        records = self.sheets[url][0]
+        header = records[0].keys() if records else []
+        return {
+            column: [record.get(column, '') for record in records]
+            for column in columns if column in header
+        }
+
+def pad_columns(columns):
+    """Täydentää sarakelistat tyhjillä arvoilla yhtä pitkiksi."""
+    length = max((len(values) for values in columns.values()), default=0)
+    return {column: values + [''] * (length - len(values)) for column, values in columns.items()}
+
+# --- VÄLIMUISTI ---
+class SheetCache:
+    """
+    Taulukon URL:n mukaan avattu välimuisti jäsennetyille DataFrameille.
+
+    Args:
+        fetcher: Olio, jolla on metodit get_revision(url) ja fetch_records(url).
+        ttl (float): Sekunnit, joiden ajan kopio palautetaan tarkistamatta revisiota.
+        clock: Aikafunktio (oletuksena time.monotonic), vaihdettavissa kokeiluja varten.
+    """
+    def __init__(self, fetcher, ttl=DEFAULT_SHEET_TTL, clock=time.monotonic):
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}
+        self.lock = threading.Lock()
+        # Jokaisella taulukolla on oma lukkonsa, jotta eri taulukot voidaan ladata yhtä aikaa
+        self.url_locks = {}
+        self.hits = 0
+        self.revalidations = 0
+        self.downloads = 0
+
+    def get(self, url, parse, force=False, columns=None, revalidate=False):
+        """
+        Palauttaa taulukon jäsennettynä DataFramena (kopiona).
+
+        parse muuntaa get_all_records-tyyppisen rivilistan DataFrameksi. Jos
+        columns annetaan, haetaan vain ne sarakkeet (fetch_columns) ja parse saa
+        {sarake: arvolista} -sanakirjan. revalidate=True ohittaa TTL:n mutta
+        tarkistaa revision, joten tiedot ladataan vain, jos taulukko on muuttunut.
+        force=True ohittaa TTL:n ja revision tarkistuksen ja lataa tiedot aina uudelleen.
+        """
+        key = url if columns is None else (url, tuple(columns))
+        with self.url_lock(url):
+            entry = self.entries.get(key)
+            now = self.clock()
+            if entry is not None and not force:
+                if not revalidate and now - entry['checked_at'] < self.ttl:
+                    self.hits += 1
+                    metrics.count('sheets_cache_hits')
+                    return entry['df'].copy()
+                with metrics.span('sheets_revision'):
+                    revision = self.fetcher.get_revision(url)
+                if revision is not None and revision == entry['revision']:
+                    entry['checked_at'] = now
+                    self.revalidations += 1
+                    metrics.count('sheets_revalidations')
+                    return entry['df'].copy()
+            else:
+                with metrics.span('sheets_revision'):
+                    revision = self.fetcher.get_revision(url)
+
+            with metrics.span('sheets_download'):
+                if columns is None:
+                    df = parse(self.fetcher.fetch_records(url))
+                else:
+                    df = parse(self.fetcher.fetch_columns(url, columns))
+            self.entries[key] = {'df': df, 'revision': revision, 'checked_at': now}
+            self.downloads += 1
+            metrics.count('sheets_downloads')
+            return df.copy()
+
+    def url_lock(self, url):
+        with self.lock:
+            lock = self.url_locks.get(url)
+            if lock is None:
+                lock = self.url_locks[url] = threading.Lock()
+            return lock
+
+    def invalidate(self, url=None):
+        """Poistaa yhden taulukon (kaikki sen sarakehaut) tai koko välimuistin."""
+        with self.lock:
+            if url is None:
+                self.entries.clear()
+            else:
+                for key in [key for key in self.entries if key == url or (isinstance(key, tuple) and key[0] == url)]:
+                    del self.entries[key]
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'revalidations': self.revalidations,
+            'downloads': self.downloads,
+            'size': len(self.entries)
+        }
+
+# --- JÄSENNYS ---
+def parse_roster_records(records):
+    """Muuntaa rosteritaulukon rivit DataFrameksi. Puuttuva FP/GP täytetään nollalla."""
+    df = pd.DataFrame(records)
+    if 'fantasy_points_avg' not in df.columns:
+        df['fantasy_points_avg'] = 0.0
+    df['fantasy_points_avg'] = pd.to_numeric(df['fantasy_points_avg'], errors='coerce').fillna(0)
+    return df
+
+def parse_free_agent_columns(columns):
+    """
+    Muuntaa fetch_columns-sarakkeet vapaiden agenttien DataFrameksi kiinteillä
+    tyypeillä: nimi merkkijonona, joukkue ja pelipaikat kategorioina ja FP/GP
+    liukulukuna (tyhjä tai virheellinen arvo on NaN). Kokonaan tyhjät rivit
+    jätetään pois. Nostaa ValueErrorin, jos pakollisia sarakkeita puuttuu.
+    """
+    missing_columns = [col for col in ROSTER_COLUMNS if col not in columns]
+    if missing_columns:
+        raise ValueError(f"Seuraavat sarakkeet puuttuvat vapaiden agenttien tiedostosta: {', '.join(missing_columns)}")
+    names = pd.Series(columns['name'], dtype=object).astype(str)
+    teams = pd.Series(columns['team'], dtype=object).astype(str)
+    positions = pd.Series(columns['positions'], dtype=object).astype(str)
+    fantasy_points = pd.to_numeric(pd.Series(columns['fantasy_points_avg'], dtype=object), errors='coerce')
+    keep = ((names != '') | (teams != '') | (positions != '') | fantasy_points.notna()).to_numpy()
+    return pd.DataFrame({
+        'name': names[keep].to_numpy(),
+        'team': pd.Categorical(teams[keep]),
+        'positions': pd.Categorical(positions[keep]),
+        'fantasy_points_avg': fantasy_points[keep].to_numpy(dtype=float)
+    })
+
+# --- RINNAKKAINEN LATAUS ---
+def timed_load(loader):
+    """Ajaa latauksen ja palauttaa tuloksen muodossa {'data', 'error', 'seconds'}."""
+    start = time.monotonic()
+    try:
+        return {'data': loader(), 'error': None, 'seconds': time.monotonic() - start}
+    except Exception as e:
+        return {'data': None, 'error': str(e), 'seconds': time.monotonic() - start}
+
+def load_sources(loaders, timeout=DEFAULT_SOURCE_TIMEOUT):
+    """
+    Lataa lähteet yhtä aikaa säiepoolissa.
+
+    Args:
+        loaders (dict): Lähteen nimi -> argumentiton latausfunktio.
+        timeout (float tai dict): Aikakatkaisu sekunteina kaikille lähteille tai
+            lähteittäin ({nimi: sekunnit}, puuttuville DEFAULT_SOURCE_TIMEOUT).
+
+    Returns:
+        dict: Lähteen nimi -> {'data', 'error', 'seconds'}. Epäonnistuneen tai
+        aikakatkaistun lähteen data on None ja error virheilmoitus.
+
+    Aikakatkaistu lataus jää taustalle, mutta sen tulosta ei odoteta eikä käytetä.
+    """
+    results = {}
+    if not loaders:
+        return results
+    executor = ThreadPoolExecutor(max_workers=len(loaders), thread_name_prefix='source-loader')
+    start = time.monotonic()
+    # Jokainen lataus ajetaan kutsujan kontekstin kopiossa, jotta sen mittarit kirjataan kutsujan mittareihin
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, timed_load, loader)
+        for name, loader in loaders.items()
+    }
+    try:
+        for name, future in futures.items():
+            limit = timeout.get(name, DEFAULT_SOURCE_TIMEOUT) if isinstance(timeout, dict) else timeout
+            try:
+                results[name] = future.result(timeout=max(0.0, start + limit - time.monotonic()))
+            except FuturesTimeoutError:
+                results[name] = {
+                    'data': None,
+                    'error': f"Aikakatkaisu ({limit} s)",
+                    'seconds': time.monotonic() - start
+                }
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
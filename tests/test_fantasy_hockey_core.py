@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from fantasy_hockey_core import (
+    CompactRoster,
+    calculate_position_availability,
+    load_league_rosters,
+    solve_daily_lineup_exact,
+)
+
+def write_roster(path, rows, **extra):
+    roster = pd.DataFrame(rows, columns=['name', 'team', 'positions', 'fantasy_points_avg'])
+    for column, value in extra.items():
+        roster[column] = value
+    roster.to_csv(path, index=False)
+
+def test_league_rosters_from_directory(tmp_path):
+    write_roster(tmp_path / 'Hawks.csv', [['Pelaaja 1', 'BOS', 'C', 2.0]])
+    write_roster(tmp_path / 'Owls.csv', [['Pelaaja 2', 'TOR', 'D', 1.5]])
+    rosters = load_league_rosters(str(tmp_path))
+    assert list(rosters) == ['Hawks', 'Owls']
+
+def test_duplicate_league_team_across_files_raises(tmp_path):
+    write_roster(tmp_path / 'Hawks.csv', [['Pelaaja 1', 'BOS', 'C', 2.0]])
+    write_roster(tmp_path / 'league.csv', [['Pelaaja 2', 'TOR', 'D', 1.5]], fantasy_team='Hawks')
+    with pytest.raises(ValueError, match='Hawks'):
+        load_league_rosters(str(tmp_path))
+
+def test_availability_counts_negative_fp_players_as_startable():
+    schedule = pd.DataFrame({'Date': pd.to_datetime(['2025-10-07']), 'Visitor': ['BOS'], 'Home': ['TOR']})
+    roster = pd.DataFrame({
+        'name': ['Pelaaja 1', 'Pelaaja 2'],
+        'team': ['BOS', 'TOR'],
+        'positions': ['C', 'D'],
+        'fantasy_points_avg': [-1.0, 2.0]
+    })
+    limits = {'C': 1, 'LW': 1, 'RW': 1, 'D': 1, 'G': 1, 'UTIL': 0}
+
+    # FP-optimaalinen kokoonpano jättää negatiivisen pelaajan penkille...
+    assignment = solve_daily_lineup_exact(CompactRoster(roster), pd.Series([True, True]).to_numpy(), limits)
+    assert assignment['active']['C'] == []
+    # ...mutta C-paikka ei ole vapaa, koska pelaaja mahtuu sille
+    availability = calculate_position_availability(schedule, roster, limits)
+    assert availability.iloc[0].to_dict() == {'C': False, 'LW': True, 'RW': True, 'D': False, 'G': True}
@@ -0,0 +1,27 @@
+from fantasy_hockey_sheets import LocalSheetFetcher, SheetCache, parse_roster_records
+
+URL = 'https://docs.google.com/spreadsheets/d/roster'
+
+def roster_records(fpa):
+    return [{'name': 'Pelaaja 1', 'team': 'BOS', 'positions': 'C', 'fantasy_points_avg': fpa}]
+
+def test_revalidate_inside_ttl_picks_up_changed_revision():
+    fetcher = LocalSheetFetcher({URL: roster_records(2.0)})
+    now = [0.0]
+    cache = SheetCache(fetcher, ttl=300, clock=lambda: now[0])
+    assert cache.get(URL, parse_roster_records)['fantasy_points_avg'].tolist() == [2.0]
+
+    fetcher.set_records(URL, roster_records(5.0))
+    now[0] = 10.0
+    # Ilman tarkistusta TTL:n sisällä palautetaan vanha kopio
+    assert cache.get(URL, parse_roster_records)['fantasy_points_avg'].tolist() == [2.0]
+    assert cache.get(URL, parse_roster_records, revalidate=True)['fantasy_points_avg'].tolist() == [5.0]
+    assert fetcher.fetch_count == 2
+
+def test_revalidate_without_changes_does_not_download():
+    fetcher = LocalSheetFetcher({URL: roster_records(2.0)})
+    cache = SheetCache(fetcher, ttl=300, clock=lambda: 0.0)
+    cache.get(URL, parse_roster_records)
+    cache.get(URL, parse_roster_records, revalidate=True)
+    assert fetcher.fetch_count == 1
+    assert cache.stats()['revalidations'] == 1